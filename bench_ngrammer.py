@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmarks for ngrammer
+
+Generates a synthetic corpus of several authors in a temporary directory,
+then times each stage separately:
+    load_corpus, set_model for word and char ngrams of several lengths,
+    and for each of those models summarise and compute_distance over
+    every author.
+Each result gives the seconds taken, the throughput in MB of text and
+ngrams per second where they apply, and the peak resident memory of the
+process so far. The results are printed as JSON (or written with
+--output) so that runs of different versions can be compared.
+
+Synthetic corpus:
+    Every author draws words from one shared vocabulary of random words
+    with Zipf-distributed frequencies, but with the ranks of a share of
+    the words shuffled, so authors differ the way real ones do: in how
+    often they use common words. Words are put into sentences with
+    capitals, commas, full stops and paragraph breaks, so that both
+    preprocessing modes have something to strip.
+
+Usage:
+    python bench_ngrammer.py --authors 4 --docs 200 --doc-size 50000
+"""
+
+
+import argparse, json, os, platform, random, shutil, string, sys, tempfile
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import ngrammer
+
+
+def make_vocabulary(size, rng):
+    """Return a list of size distinct random lowercase words, shorter
+    words first as in real text"""
+    words = set()
+    while len(words) < size:
+        length = min(1 + int(rng.expovariate(0.3)), 14)
+        words.add("".join(rng.choices(string.ascii_lowercase, k=length)))
+    return sorted(words, key=lambda w: (len(w), w))
+
+
+def author_weights(size, rng, exponent=1.07, shuffled=0.2):
+    """Return cumulative Zipf weights over the vocabulary for one author,
+    with the ranks of a share of the words shuffled"""
+    ranks = list(range(1, size + 1))
+    moved = rng.sample(range(size), int(size * shuffled))
+    targets = moved[:]
+    rng.shuffle(targets)
+    for i, j in zip(moved, targets):
+        ranks[i] = j + 1
+    cumulative, total = [], 0.0
+    for rank in ranks:
+        total += rank ** -exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def make_text(size, vocabulary, weights, rng):
+    """Return about size characters of sentences drawn from vocabulary"""
+    parts, length = [], 0
+    while length < size:
+        words = rng.choices(vocabulary, cum_weights=weights,
+                            k=rng.randint(5, 25))
+        words[0] = words[0].capitalize()
+        for i in range(2, len(words) - 1, 7):
+            words[i] += ","
+        sentence = " ".join(words) + rng.choice(".....!?")
+        sentence += "\n\n" if rng.random() < 0.2 else " "
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)
+
+
+def make_corpus(directory, authors, docs, doc_size, vocab_size, seed):
+    """Write docs text files of about doc_size characters, shared out
+    between authors, to directory. Files are named <author>_<n>.txt.
+    Returns the total size of the texts in bytes."""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocab_size, rng)
+    weights = [author_weights(vocab_size, rng) for _ in range(authors)]
+    total = 0
+    for i in range(docs):
+        author = i % authors
+        text = make_text(doc_size, vocabulary, weights[author], rng)
+        name = "a{0}_{1:05d}.txt".format(author, i)
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(text)
+        total += len(text.encode("utf-8"))
+    return total
+
+
+def author_from_name(name):
+    return os.path.basename(name).split("_")[0]
+
+
+def peak_rss_kb():
+    """Return the peak resident memory of this process in KB, or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in bytes on macOS and KB elsewhere
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def timed(stage, function, **fields):
+    """Call function and return (its result, a result dict for stage)"""
+    start = time.perf_counter()
+    value = function()
+    seconds = time.perf_counter() - start
+    result = {"stage": stage}
+    result.update(fields)
+    result["seconds"] = round(seconds, 6)
+    return value, result
+
+
+def rate(amount, seconds):
+    return round(amount / seconds, 3) if seconds > 0 else None
+
+
+def run(args, directory):
+    """Run every stage on the corpus in directory; returns the results"""
+    nbytes = make_corpus(directory, args.authors, args.docs, args.doc_size,
+                         args.vocab, args.seed)
+    mb = nbytes / 1e6
+    results = []
+    corpus, result = timed("load_corpus", lambda: ngrammer.Corpus(
+        ).load_corpus(directory, author_id=author_from_name))
+    result["mb_per_s"] = rate(mb, result["seconds"])
+    result["peak_rss_kb"] = peak_rss_kb()
+    results.append(result)
+    authors = sorted(corpus.author_docs)
+    configs = [(True, n) for n in args.word_orders] + \
+              [(False, n) for n in args.char_orders]
+    for word_ngrams, n in configs:
+        mode = "word" if word_ngrams else "char"
+        _, result = timed("set_model", lambda: corpus.set_model(
+            n, word_ngrams, args.engine, workers=args.workers),
+            mode=mode, ngram_len=n)
+        ngrams = sum(sum(doc.ngram_freq.values())
+                     for doc in corpus.documents.values())
+        result["mb_per_s"] = rate(mb, result["seconds"])
+        result["ngrams"] = ngrams
+        result["ngrams_per_s"] = rate(ngrams, result["seconds"])
+        result["peak_rss_kb"] = peak_rss_kb()
+        results.append(result)
+        summaries, result = timed("summarise", lambda: {
+            a: corpus.summarise(a, args.num) for a in authors},
+            mode=mode, ngram_len=n, authors=len(authors))
+        result["peak_rss_kb"] = peak_rss_kb()
+        results.append(result)
+        pairs = [(a, b) for a in authors for b in authors if a < b]
+        _, result = timed("compute_distance", lambda: [
+            ngrammer.compute_distance(summaries[a], summaries[b])
+            for a, b in pairs], mode=mode, ngram_len=n, pairs=len(pairs))
+        result["peak_rss_kb"] = peak_rss_kb()
+        results.append(result)
+    return {"corpus": {"documents": args.docs, "authors": args.authors,
+                       "bytes": nbytes},
+            "results": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time ngrammer on a synthetic corpus and print JSON")
+    parser.add_argument("--authors", type=int, default=3)
+    parser.add_argument("--docs", type=int, default=30,
+                        help="number of documents, shared out between authors")
+    parser.add_argument("--doc-size", type=int, default=20000,
+                        help="characters per document")
+    parser.add_argument("--vocab", type=int, default=5000,
+                        help="number of distinct words")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--word-orders", type=int, nargs="*",
+                        default=[1, 2, 3])
+    parser.add_argument("--char-orders", type=int, nargs="*",
+                        default=[2, 4, 8])
+    parser.add_argument("--engine", default="python",
+                        choices=sorted(ngrammer.Document.ENGINES))
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--num", type=int, default=20,
+                        help="ngrams per author summary")
+    parser.add_argument("--output", help="write the JSON here, not stdout")
+    parser.add_argument("--keep", help="generate the corpus in this "
+                        "directory and keep it")
+    args = parser.parse_args(argv)
+
+    start_rss = peak_rss_kb()
+    directory = args.keep or tempfile.mkdtemp(prefix="ngrammer-bench-")
+    os.makedirs(directory, exist_ok=True)
+    try:
+        report = run(args, directory)
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+    report["params"] = vars(args)
+    report["peak_rss_kb_at_start"] = start_rss
+    report["python"] = platform.python_version()
+    report["platform"] = platform.platform()
+    report["numpy"] = ngrammer.np.__version__ if ngrammer.np else None
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
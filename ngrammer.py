@@ -12,6 +12,11 @@ ngrams in text documents.
 
 
 
+Importing the module has no side effects. Run as a script it is a batch
+command line tool (python -m ngrammer --help) with build, summarise,
+attribute, score, sweep and serve subcommands; with no arguments it runs
+the sample usage at the end of this file on texts.zip.
+
 It consists two classes:
     1) Document - a class which contains text, and from which n-grams, and 
     frequencies can be calculated.
@@ -32,81 +37,1593 @@ Regex compilation:
     repeated recompilation. 
     
 
-Summarise/Calc_stats methods within Corpus:
+Summarise method within Corpus and NgramStats:
     The summarise method builds a list of dictionaries of ngram frequencies
     based on a particular author within self.author_docs.
-    The method then loops through each document and adds counts of every
-    ngram found to a 'count' dictionary. 
-    However, the consequence of this is that zero occurences is not listed.
-    To correct for this, the first two lines of the calc_stats method
-    calculates how many zero-values need to be appended.
-    This was done to avoid extra testing for nulls and the fact that
-    average and standard deviation calculations are not affected by the 
-    location of these zero values.
+    The method then loops through each document and adds the counts of every
+    ngram found to running NgramStats accumulators: the number of documents
+    containing it, its total count and its sum of squared counts.
+    Zero occurences are not listed. They need no padding, as they add
+    nothing to either sum: the mean and standard deviation are computed
+    over the author's number of documents from the sums alone.
+    The top ngrams are picked with a heap rather than a full sort.
     
+Approximate counting:
+    set_model(..., sketch=(width, depth)) keeps no per-document counts.
+    Each Document is counted, added to its author's SketchStats and its
+    counts are dropped, so memory is fixed by the sketch size whatever the
+    number of distinct ngrams. SketchStats keeps exact sums for a bounded
+    set of candidate top ngrams and moves the sums of those it drops to
+    Count-Min Sketches, which never undercount and overcount a total by
+    more than e / width of the dropped count with probability at most
+    exp(-depth). The deviation of an ngram that was dropped and came
+    back has no such bound. summarise returns estimates in the usual
+    form, so compute_distance works on them unchanged.
+    set_model(..., heavy_hitters=k) instead keeps a Misra-Gries summary of
+    at most k candidate ngrams per author (HeavyHitters). Any ngram whose
+    total is more than the author's count / (k + 1) is among them, and
+    HeavyHitters.guaranteed tells when the top num and their stats are exact.
+
+N-gram keys:
+    N-grams are not stored as joined strings. Each unit (a character's
+    code point, or a word's id in a Vocabulary shared by the Corpus) is
+    written as a fixed-width big-endian field and the fields of a window
+    are packed into a single int. Keys are only decoded back to the
+    readable "a, b, c" form when they are printed.
+
+Lean documents:
+    Document has __slots__, and Corpus(counts_only=True) makes Documents
+    that keep neither the list of their ngrams nor their preprocessed
+    units, only the raw text (or its source) and the counts. Memory per
+    document then grows with its distinct ngrams rather than its length;
+    Document.iter_ngrams regenerates the ngrams in order when needed.
+
+Pruning:
+    Attribution only uses frequent ngrams, yet for n >= 4 most keys of a
+    model are ngrams seen once. set_model(..., min_df, min_count,
+    max_features) prunes the counts once every Document is counted,
+    keeping the ngrams in enough documents and often enough overall, and
+    at most the max_features most frequent per length. This shrinks the
+    model kept, not the peak memory of counting: the thresholds need
+    every ngram's document frequency and total, and for long ngrams,
+    mostly seen once, those tables are about as large as the counts
+    themselves. stop drops a list of ngrams from each Document as it is
+    counted. Documents counted afterwards keep the same features.
+
+Term matrix:
+    Corpus.term_matrix builds a sparse document x ngram count matrix of one
+    ngram length in CSR form (NumPy arrays indptr, indices and counts) with
+    the ngram keys of its columns shared by all documents. Rows are grouped
+    by author, so TermMatrix.view gives an author's rows without copying,
+    and their means and standard deviations for every ngram come from two
+    np.bincount reductions.
+
+Distances:
+    compute_distance compares two summaries over the ngrams they share.
+    DistanceEngine instead fixes one feature space for every author, the
+    most frequent ngrams of a TermMatrix, and scores a batch of documents
+    against all author profiles at once with array operations:
+    Euclidean, cosine, Manhattan or Burrows' Delta, the mean absolute
+    difference of z-scores over the Corpus documents. Documents are
+    compared by relative frequencies (counts over the document's total),
+    and profiles are the authors' mean relative frequencies, so text
+    length does not bias the result.
+
+Count cache:
+    A Corpus given a CountCache looks up every Document's counts in a
+    cache directory before counting, keyed by a hash of its text, the
+    tokenisation mode and the ngram length, so set_model only counts the
+    documents that changed. Entries are count_table tables in a compact
+    binary form (fixed-width keys, zlib-compressed), and the least
+    recently used ones are deleted once the directory passes a size bound.
+
+Suffix index:
+    Corpus.build_index makes a SuffixIndex of one tokenisation mode: a
+    suffix array and LCP array over the preprocessed units of all
+    documents, each ended by a separator of its own so no ngram spans two
+    documents. All occurrences of an ngram are one run of the suffix
+    array, and the runs of length n are where the LCP drops below n, so
+    counts of any length come from one scan without generating windows.
+    summarise then reads lengths that set_model did not count from it.
+
+Author profiles:
+    Corpus.profiles detaches the author summaries, with the lengths and
+    modes they were made with and only the words their keys use, as
+    AuthorProfiles. save writes them to a small versioned binary file
+    that load_profiles reads back, and AuthorProfiles.distances scores a
+    new text against them with compute_distance, counting only that
+    text: the training texts are not needed again.
+
+Attribution server:
+    AttributionServer keeps AuthorProfiles resident behind a local HTTP
+    service (python -m ngrammer serve) that scores posted texts. Its
+    model is one (generation, profiles) tuple, replaced in a single
+    assignment once a new model is completely built, so requests never
+    wait for a rebuild or see part of one.
+
+Instrumentation:
+    Corpus.instrument() attaches an Instrumentation that every Document
+    of the Corpus shares. It totals wall and CPU time per stage
+    (preprocess, count, set_model, summarise, compute_distance when given
+    corpus.stats) along with documents, characters, ngrams counted and
+    distinct keys, and passes each single record to an optional hook.
+    Until then corpus.stats is None and each stage only tests for that.
+
 Author names
     The insert_document method takes the author name from the first character
     of the filename. However, the function could also be used to add extra
     documents with other authors.
+    load_corpus accepts any author_id function of the file name in place of
+    the default author_from_filename.
+
+Archives:
+    load_corpus reads a directory, a zip or tar archive (optionally gzip,
+    bz2 or xz compressed), or a single .gz/.bz2/.xz file directly. Nothing
+    is extracted to disk.
+
+Packed corpora:
+    Corpus.pack writes all texts as one UTF-8 file plus a small JSON
+    index of byte ranges and authors; open_packed reads only the index
+    and inserts streamed Documents over a read-only memory map of the
+    texts. Nothing is decoded until set_model counts a Document, and
+    worker processes map the same file, so the texts are held once in
+    the page cache however many workers there are.
 """
 
 
-import re, string, zipfile, glob
-#zipfile is a standard module for extracting files from zip
-#glob is used to find all the files with matching patterns extracted from zip
+import re, string, zipfile, tarfile, fnmatch, io, os, sys, collections, heapq
+import hashlib, struct, zlib, json, mmap, math, random, time, argparse
+import threading, itertools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+#zipfile and tarfile are standard modules for reading archives
+#fnmatch is used to find all the files with matching patterns in them
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+#NumPy is optional: it is only used by the "numpy" counting engine, by
+#Corpus.term_matrix and by DistanceEngine
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Modules for compressed single files, by file extension
+COMPRESSED_MODULES = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma"}
+
+#Bytes per packed unit: code points fit in 3 bytes, vocabulary ids in 4
+CHAR_WIDTH = 3
+WORD_WIDTH = 4
+NATIVE_UTF32 = "utf-32-le" if sys.byteorder == "little" else "utf-32-be"
+
+
+class Vocabulary(object):
+    """Interns word tokens as consecutive integer ids.
+
+    Public attributes:
+    ids: dict of token to id
+    tokens: list of tokens, indexed by id
+    """
+    
+    def __init__(self, tokens=()):
+        self.ids = {}
+        self.tokens = []
+        for token in tokens:
+            self.add(token)
+    
+    def __len__(self):
+        return len(self.tokens)
+    
+    def add(self, token):
+        """Return the id for token, assigning the next free id if new"""
+        i = self.ids.get(token)
+        if i is None:
+            i = self.ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return i
+    
+    def encode(self, tokens):
+        """Return a list of ids for tokens, adding any unseen tokens"""
+        ids = self.ids
+        add = self.add
+        return [ids[t] if t in ids else add(t) for t in tokens]
+
+
+class NgramStats(object):
+    """Running accumulators of ngram counts over a set of documents.
+
+    Public attributes:
+    num_docs: number of documents added
+    doc_freq: dict of ngram to number of documents containing it
+    total: dict of ngram to its total count
+    sumsq: dict of ngram to the sum of its squared per-document counts
+    ordered: False once a document is removed, when the ngrams may no
+             longer be in the order of their first occurrence (see top)
+    """
+    
+    def __init__(self):
+        self.num_docs = 0
+        self.doc_freq = {}
+        self.total = {}
+        self.sumsq = {}
+        self.ordered = True
+    
+    def add(self, freq):
+        """Add one document's dict of ngram frequencies"""
+        self.num_docs += 1
+        doc_freq, total, sumsq = self.doc_freq, self.total, self.sumsq
+        for k, v in freq.items():
+            if k in total:
+                doc_freq[k] += 1
+                total[k] += v
+                sumsq[k] += v * v
+            else:
+                doc_freq[k] = 1
+                total[k] = v
+                sumsq[k] = v * v
+    
+    def remove(self, freq):
+        """Remove one previously added document's dict of frequencies"""
+        self.num_docs -= 1
+        self.ordered = False
+        doc_freq, total, sumsq = self.doc_freq, self.total, self.sumsq
+        for k, v in freq.items():
+            if doc_freq[k] == 1:
+                del doc_freq[k], total[k], sumsq[k]
+            else:
+                doc_freq[k] -= 1
+                total[k] -= v
+                sumsq[k] -= v * v
+    
+    def top(self, num, freqs=None):
+        """Return the num ngrams with the highest total count, ties in
+        the order they were first added (as a stable sort would).
+        Once a document has been removed that order depends on history:
+        freqs, the dicts of frequencies of the documents still added in
+        the order a rebuild would add them, then gives the order of
+        first occurrence for the ngrams tied with those chosen. Only as
+        many documents are read as it takes to find them all."""
+        total = self.total
+        top = heapq.nlargest(num, total, key=total.__getitem__)
+        if self.ordered or freqs is None or not top:
+            return top
+        cut = total[top[-1]]
+        tied = [k for k, v in total.items() if v >= cut]
+        rank, pending = {}, set(tied)
+        for d, freq in enumerate(freqs):
+            hits = {k for k in pending if k in freq}
+            if hits:
+                for i, k in enumerate(freq):
+                    if k in hits:
+                        rank[k] = (d, i)
+                pending -= hits
+                if not pending:
+                    break
+        tied.sort(key=lambda k: (-total[k], rank[k]))
+        return tied[:num]
+    
+    def calc_stats(self, key):
+        """Returns the mean and standard deviation of the count of key
+        over num_docs documents; documents without it count as zero"""
+        n = self.num_docs
+        total = self.total.get(key, 0)
+        avg = total / n
+        #n * sum of squared deviations is an exact integer
+        ss = (n * self.sumsq.get(key, 0) - total * total) / n
+        return round(avg, 2), round(stdev(ss, n), 2)
+    
+    def summary(self, num=20, freqs=None):
+        """Returns {ngram: (mean, std. deviation)} for the top num
+        ngrams (see top for freqs)"""
+        return {k: self.calc_stats(k) for k in self.top(num, freqs)}
+
+
+class CountMinSketch(object):
+    """Count-Min Sketch of ngram counts: depth rows of width counters,
+    one hash function per row. estimate never undercounts; it
+    overcounts by more than epsilon * count (count being the sum of all
+    counts added) with probability at most delta.
+    Sketches made with the same width, depth and seed hash keys alike.
+
+    Public attributes:
+    width, depth: shape of the counters
+    count: sum of all counts added
+    """
+    #Mersenne prime modulus of the hash functions (a * key + b) % PRIME
+    PRIME = (1 << 61) - 1
+    
+    def __init__(self, width=1 << 14, depth=4, seed=0):
+        rng = random.Random(seed)
+        self.width = width
+        self.depth = depth
+        p = self.PRIME
+        self.hashes = [(rng.randrange(1, p), rng.randrange(p))
+                       for _ in range(depth)]
+        self.counters = array('q', bytes(8 * width * depth))
+        self.count = 0
+    
+    @property
+    def epsilon(self):
+        return math.e / self.width
+    
+    @property
+    def delta(self):
+        return math.exp(-self.depth)
+    
+    def error(self):
+        """Bound on the overcount of any estimate, holding with
+        probability 1 - delta"""
+        return self.epsilon * self.count
+    
+    def indexes(self, key):
+        """Return the counter of key in each row"""
+        p, width = self.PRIME, self.width
+        return [row * width + (a * key + b) % p % width
+                for row, (a, b) in enumerate(self.hashes)]
+    
+    def add(self, indexes, count):
+        """Add count to the counters at indexes (see indexes); a
+        negative count removes a count added before"""
+        counters = self.counters
+        for i in indexes:
+            counters[i] += count
+        self.count += count
+    
+    def estimate(self, key):
+        counters = self.counters
+        return min(counters[i] for i in self.indexes(key))
+
+
+class SketchStats(object):
+    """Approximate NgramStats in fixed memory. Every ngram of a document
+    added becomes a candidate, with exact sums of its counts and squared
+    counts from then on. When there are more than 2 * capacity
+    candidates, all but the capacity with the highest totals are
+    dropped and their sums are added to two CountMinSketches. An ngram
+    that becomes a candidate again takes its estimates there as its
+    sums before it re-entered.
+    Only dropped ngrams are sketched, so an ngram that has stayed a
+    candidate since it was first added, as the top ones normally have,
+    has exact sums but for any overcount of the sketches when it
+    entered. Estimated totals overcount by at most total.error() (the
+    mean by error()) with probability 1 - total.delta. The sum of
+    squares of an ngram is taken from the same sketch row as its total,
+    but its deviation has no error bound once that part is not 0.
+    Documents are numbered as they are added (see HeavyHitters).
+
+    Public attributes:
+    num_docs: number of documents added
+    added: number of the last document added
+    total, sumsq: CountMinSketch of the sums of the counts and squared
+                  counts of dropped candidates
+    candidates: dict of ngram to [total, sum of squares, number of the
+                document it entered with, estimated total and sum of
+                squares before then]
+    capacity: number of candidates kept after dropping
+    """
+    
+    def __init__(self, width=1 << 14, depth=4, capacity=1000):
+        self.num_docs = 0
+        self.added = 0
+        self.total = CountMinSketch(width, depth)
+        self.sumsq = CountMinSketch(width, depth)
+        self.candidates = {}
+        self.capacity = capacity
+    
+    def estimates(self, key):
+        """Return the estimated total and sum of squares of key in the
+        sketches, both from the row giving the lowest total"""
+        #Both sketches have the same seed, so they hash keys alike
+        counters = self.total.counters
+        i = min(self.total.indexes(key), key=counters.__getitem__)
+        return counters[i], self.sumsq.counters[i]
+    
+    def add(self, freq):
+        """Add one document's dict of ngram frequencies; returns the
+        number the document is removed with"""
+        self.num_docs += 1
+        self.added += 1
+        candidates = self.candidates
+        for k, v in freq.items():
+            entry = candidates.get(k)
+            if entry is None:
+                candidates[k] = [v, v * v, self.added] + list(
+                    self.estimates(k))
+            else:
+                entry[0] += v
+                entry[1] += v * v
+        if len(candidates) > 2 * self.capacity:
+            self.prune()
+        return self.added
+    
+    def remove(self, freq, number):
+        """Remove the dict of frequencies of the document add numbered
+        number: from the exact sums of the candidates that entered with
+        it or before, else from the sketches"""
+        self.num_docs -= 1
+        candidates = self.candidates
+        for k, v in freq.items():
+            entry = candidates.get(k)
+            if entry is not None and entry[2] <= number:
+                entry[0] -= v
+                entry[1] -= v * v
+                continue
+            i = self.total.indexes(k)
+            self.total.add(i, -v)
+            self.sumsq.add(i, -v * v)
+            if entry is not None:
+                entry[3] -= v
+                entry[4] -= v * v
+    
+    def prune(self):
+        """Keep the capacity candidates with the highest totals, in the
+        order they were first seen, and add the sums of the others to
+        the sketches"""
+        candidates = self.candidates
+        keep = set(heapq.nlargest(self.capacity, candidates,
+                                  key=lambda k: candidates[k][0] +
+                                  candidates[k][3]))
+        for k, entry in candidates.items():
+            if k not in keep:
+                i = self.total.indexes(k)
+                self.total.add(i, entry[0])
+                self.sumsq.add(i, entry[1])
+        self.candidates = {k: v for k, v in candidates.items() if k in keep}
+    
+    def top(self, num):
+        """Return the num candidates with the highest estimated total"""
+        candidates = self.candidates
+        return heapq.nlargest(num, candidates,
+                              key=lambda k: candidates[k][0] +
+                              candidates[k][3])
+    
+    def calc_stats(self, key):
+        """Returns the estimated mean and standard deviation of the count
+        of key over num_docs documents"""
+        n = self.num_docs
+        entry = self.candidates.get(key)
+        if entry is None:
+            total, sumsq = self.estimates(key)
+        else:
+            total, sumsq = entry[0] + entry[3], entry[1] + entry[4]
+        #Overcounts of the sketches can make the variance negative
+        ss = max(n * sumsq - total * total, 0) / n
+        return round(total / n, 2), round(stdev(ss, n), 2)
+    
+    def error(self):
+        """Bound on the overcount of an estimated mean"""
+        return self.total.error() / self.num_docs
+    
+    def summary(self, num=20):
+        """Returns {ngram: (mean, std. deviation)} for the top num
+        ngrams"""
+        return {k: self.calc_stats(k) for k in self.top(num)}
+
+
+class HeavyHitters(object):
+    """Approximate NgramStats keeping at most capacity candidate ngrams,
+    as a Misra-Gries summary merged one document at a time: when a
+    document brings the candidates over capacity, the (capacity + 1)-th
+    largest weight is subtracted from every weight and the candidates
+    left without weight are dropped. The weight of an ngram undercounts
+    its total by at most offset, the sum of those subtractions, which is
+    at most count / (capacity + 1).
+    The total and sum of squares reported for a candidate are counted
+    exactly from the document that made it a candidate; its total before
+    then is at most the offset it entered with. Documents are numbered
+    as they are added, so that removing one only takes its counts off
+    the candidates that were counting when it was added.
+    With no more distinct ngrams than capacity nothing is dropped and
+    summary equals that of NgramStats.
+
+    Public attributes:
+    num_docs: number of documents added
+    added: number of the last document added
+    count: sum of all counts added
+    offset: total weight subtracted from every candidate so far
+    candidates: dict of ngram to [weight, total, sum of squares, offset
+                on entry, number of the document it entered with]
+    capacity: number of candidates kept
+    """
+    
+    def __init__(self, capacity=1000):
+        self.num_docs = 0
+        self.added = 0
+        self.count = 0
+        self.offset = 0
+        self.candidates = {}
+        self.capacity = capacity
+    
+    def add(self, freq):
+        """Add one document's dict of ngram frequencies; returns the
+        number the document is removed with"""
+        self.num_docs += 1
+        self.added += 1
+        candidates = self.candidates
+        for k, v in freq.items():
+            entry = candidates.get(k)
+            if entry is None:
+                candidates[k] = [v, v, v * v, self.offset, self.added]
+            else:
+                entry[0] += v
+                entry[1] += v
+                entry[2] += v * v
+            self.count += v
+        if len(candidates) > self.capacity:
+            self.reduce()
+        return self.added
+    
+    def remove(self, freq, number):
+        """Remove the dict of frequencies of the document add numbered
+        number from the candidates that have counted it: those that
+        entered with it or before.
+
+        >>> h = HeavyHitters(1)
+        >>> number = h.add({1: 7, 2: 8})
+        >>> h.add({1: 5}), h.add({1: 5})
+        (2, 3)
+        >>> h.remove({1: 7, 2: 8}, number)
+        >>> h.summary(1)
+        {1: (5.0, 0.0)}
+        """
+        self.num_docs -= 1
+        candidates = self.candidates
+        for k, v in freq.items():
+            self.count -= v
+            entry = candidates.get(k)
+            if entry is not None and entry[4] <= number:
+                entry[0] = max(entry[0] - v, 0)
+                entry[1] -= v
+                entry[2] -= v * v
+    
+    def reduce(self):
+        """Subtract the (capacity + 1)-th largest weight from every weight
+        and drop the candidates left without weight, keeping order"""
+        weights = [entry[0] for entry in self.candidates.values()]
+        cut = heapq.nlargest(self.capacity + 1, weights)[-1]
+        self.offset += cut
+        candidates = {}
+        for k, entry in self.candidates.items():
+            if entry[0] > cut:
+                entry[0] -= cut
+                candidates[k] = entry
+        self.candidates = candidates
+    
+    def top(self, num):
+        """Return the num candidates with the highest total, ties in the
+        order they became candidates"""
+        candidates = self.candidates
+        return heapq.nlargest(num, candidates,
+                              key=lambda k: candidates[k][1])
+    
+    def guaranteed(self, num):
+        """Returns whether summary(num) is certainly exact: every ngram
+        in top(num) has been a candidate since the first document, so
+        its total and sum of squares are exact, and every total in it is
+        at least the largest total any other ngram could have"""
+        top = self.top(num)
+        if not top:
+            return True
+        if any(self.candidates[k][3] for k in top):
+            return False
+        chosen = set(top)
+        #Ngrams that are not candidates have a total of at most offset
+        bound = max([self.offset] + [entry[1] + entry[3] for k, entry
+                     in self.candidates.items() if k not in chosen])
+        return min(self.candidates[k][1] for k in top) >= bound
+    
+    def calc_stats(self, key):
+        """Returns the mean and standard deviation of the count of key
+        over num_docs documents, counted since key became a candidate"""
+        n = self.num_docs
+        total, sumsq = self.candidates.get(key, (0, 0, 0))[1:3]
+        ss = (n * sumsq - total * total) / n
+        return round(total / n, 2), round(stdev(ss, n), 2)
+    
+    def error(self):
+        """Bound on the undercount of a mean"""
+        return self.offset / self.num_docs
+    
+    def summary(self, num=20):
+        """Returns {ngram: (mean, std. deviation)} for the top num
+        ngrams"""
+        return {k: self.calc_stats(k) for k in self.top(num)}
+
+
+class AuthorProfiles(object):
+    """Author summaries (see Corpus.summarise) detached from their
+    Corpus, made by Corpus.profiles and saved and loaded as a versioned
+    binary file (see save and load_profiles).
+
+    Public attributes:
+    summaries: dict of author to {ngram: (mean, std. deviation)}
+    params: dict of author to the (ngram_len, word_ngrams) of the summary
+    vocabulary: Vocabulary of the words used by word ngram keys
+    """
+    
+    MAGIC = b"NGPR"
+    VERSION = 1
+    
+    def __init__(self, summaries, params, vocabulary):
+        self.summaries = summaries
+        self.params = params
+        self.vocabulary = vocabulary
+    
+    def summarise_text(self, text, ngram_len, word_ngrams, num):
+        """Returns the summary of a single text as summarise would give
+        it: its num commonest ngrams with their counts and a deviation of
+        0.0. The profiles' vocabulary is not changed."""
+        doc = Document(text, None, Vocabulary(self.vocabulary.tokens),
+                       counts_only=True)
+        doc.word_ngrams = word_ngrams
+        doc.set_ngrams(ngram_len)
+        stats = NgramStats()
+        stats.add(doc.ngram_freq)
+        return stats.summary(num)
+    
+    def distances(self, text, authors=None):
+        """Returns {author: compute_distance of the author's summary and
+        the text's}, the text summarised with the author's length and
+        mode and as many ngrams as the author's summary holds, for the
+        given authors or all of them if authors is None"""
+        queries = {}
+        result = {}
+        for author in self.summaries if authors is None else authors:
+            summary = self.summaries[author]
+            params = self.params[author] + (len(summary),)
+            if params not in queries:
+                queries[params] = self.summarise_text(text, *params)
+            result[author] = compute_distance(summary, queries[params])
+        return result
+    
+    def save(self, path):
+        """Write the profiles to path: MAGIC and VERSION, then zlib
+        compressed the vocabulary and, per author, its name, length,
+        mode, keys as fixed-width fields, means and deviations"""
+        parts = [encode_tokens(self.vocabulary.tokens)]
+        for author, summary in self.summaries.items():
+            n, word_ngrams = self.params[author]
+            size = n * unit_width(word_ngrams)
+            parts.append(encode_tokens([str(author)]))
+            parts.append(struct.pack("<IBI", n, bool(word_ngrams),
+                                     len(summary)))
+            parts.append(b"".join(k.to_bytes(size, "big") for k in summary))
+            values = array('d', [v[0] for v in summary.values()] +
+                                [v[1] for v in summary.values()])
+            if sys.byteorder == "big":
+                values.byteswap()
+            parts.append(values.tobytes())
+        with open(path, "wb") as f:
+            f.write(struct.pack("<4sH", self.MAGIC, self.VERSION))
+            f.write(zlib.compress(b"".join(parts)))
+
+
+class AttributionServer(ThreadingHTTPServer):
+    """Local HTTP service scoring texts against resident AuthorProfiles,
+    one thread per request. Every request reads self.model once, so it
+    is answered wholly by the model current when it arrived; reload
+    builds a new model in a background thread and swap replaces the
+    tuple only when it is complete. Reloads are numbered as they are
+    requested, and a build that finishes after that of a later request
+    is discarded.
+
+    Endpoints, all answering JSON:
+    GET /model: generation, authors, their (ngram_len, word_ngrams) and
+        the error of the last failed reload
+    POST /attribute: the body is the query text, or JSON
+        {"text": ..., "authors": [...]}; answers generation, distances
+        and the nearest author
+    POST /reload: JSON {"profiles": path}, or {"corpus": path} with any
+        of the other arguments of build_profiles; answers 202 at once
+
+    Public attributes:
+    model: (generation, AuthorProfiles)
+    reload_error: message of the last failed reload, or None
+    requested: number of the last reload requested
+    installed: number of the reload the model was built by (0 for the
+               initial one)
+    """
+    daemon_threads = True
+    
+    def __init__(self, profiles, address=("127.0.0.1", 8000)):
+        ThreadingHTTPServer.__init__(self, address, AttributionHandler)
+        self.model = (1, profiles)
+        self.reload_error = None
+        self.requested = self.installed = 0
+        self.swap_lock = threading.Lock()
+    
+    def swap(self, profiles, request=None):
+        """Make profiles the model; returns its generation. request is
+        the number of the reload that built profiles: if a later reload
+        has already been swapped in, nothing changes and None is
+        returned."""
+        with self.swap_lock:
+            if request is not None:
+                if request < self.installed:
+                    return None
+                self.installed = request
+            generation = self.model[0] + 1
+            self.model = (generation, profiles)
+        return generation
+    
+    def reload(self, spec):
+        """Build a model from spec (see /reload) in a background thread,
+        then swap it in unless a later reload got there first. Returns the
+        thread."""
+        with self.swap_lock:
+            self.requested += 1
+            request = self.requested
+        def build():
+            try:
+                if "profiles" in spec:
+                    profiles = load_profiles(spec["profiles"])
+                else:
+                    arguments = dict(spec)
+                    profiles = build_profiles(arguments.pop("corpus"),
+                                              **arguments)
+            except Exception as e:
+                if request > self.installed:
+                    self.reload_error = "{0}: {1}".format(
+                        type(e).__name__, e)
+            else:
+                if self.swap(profiles, request) is not None:
+                    self.reload_error = None
+        thread = threading.Thread(target=build, daemon=True)
+        thread.start()
+        return thread
+
+
+class AttributionHandler(BaseHTTPRequestHandler):
+    """Request handler of AttributionServer"""
+    
+    def do_GET(self):
+        if self.path != "/model":
+            return self.reply(404, {"error": "not found"})
+        generation, profiles = self.server.model
+        self.reply(200, {"generation": generation,
+                         "authors": list(profiles.summaries),
+                         "params": profiles.params,
+                         "reload_error": self.server.reload_error})
+    
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length < 0:
+                raise ValueError("negative Content-Length")
+            body = self.rfile.read(length)
+            if self.path == "/attribute":
+                self.attribute(body)
+            elif self.path == "/reload":
+                spec = json.loads(body.decode("utf-8"))
+                if not isinstance(spec, dict) or not (
+                   "profiles" in spec or "corpus" in spec):
+                    raise ValueError('give "profiles" or "corpus"')
+                self.server.reload(spec)
+                self.reply(202, {"generation": self.server.model[0]})
+            else:
+                self.reply(404, {"error": "not found"})
+        except (ValueError, KeyError) as e:
+            self.reply(400, {"error": "{0}: {1}".format(type(e).__name__, e)})
+    
+    def attribute(self, body):
+        generation, profiles = self.server.model
+        text, authors = body.decode("utf-8"), None
+        if self.headers.get("Content-Type", "").startswith(
+           "application/json"):
+            query = json.loads(text)
+            if not isinstance(query, dict):
+                raise ValueError("the JSON body must be an object")
+            text, authors = query["text"], query.get("authors")
+            if not isinstance(text, str):
+                raise ValueError('"text" must be a string')
+            if authors is not None and not (isinstance(authors, list) and
+               all(isinstance(a, str) for a in authors)):
+                raise ValueError('"authors" must be a list of strings')
+        distances = profiles.distances(text, authors)
+        nearest = min(distances, key=distances.get) if distances else None
+        self.reply(200, {"generation": generation, "distances": distances,
+                         "nearest": nearest})
+    
+    def reply(self, status, result):
+        data = json.dumps(result).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CountCache(object):
+    """Content-addressed on-disk cache of the ngram counts of documents,
+    used by Corpus.set_model. Each entry is the count table (see
+    count_table and dump_table) of one document, tokenisation mode and
+    ngram length. The least recently used entries are deleted once the
+    cache holds more than max_bytes.
+
+    Public attributes:
+    path: cache directory, created if missing
+    max_bytes: bound on the total size of the entries
+    entries: OrderedDict of entry file name to size, least recently
+             used first
+    hits, misses: numbers of lookups served and not served
+    """
+    #Part of every digest: bump when preprocessing or counting changes
+    VERSION = 1
+    
+    def __init__(self, path, max_bytes=1 << 30):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        found = [(e.stat().st_mtime, e.name, e.stat().st_size)
+                 for e in os.scandir(path) if e.name.endswith(".ngc")]
+        self.entries = collections.OrderedDict(
+            (name, size) for _, name, size in sorted(found))
+        self.size = sum(self.entries.values())
+        self.hits = 0
+        self.misses = 0
+        self.evict()
+    
+    def digest(self, doc):
+        """Returns the hex digest of a Document's text, read from its
+        source if it is streamed"""
+        digest = hashlib.sha256(b"ngrammer %d\0" % self.VERSION)
+        if doc.text is not None:
+            digest.update(doc.text.encode("utf-8", "surrogatepass"))
+        else:
+            with doc.source.open() as f:
+                for chunk in iter(lambda: f.read(Document.CHUNK_SIZE), ""):
+                    digest.update(chunk.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+    
+    def entry_name(self, digest, word_ngrams, n):
+        return "{0}-{1}{2}.ngc".format(digest, "w" if word_ngrams else "c", n)
+    
+    def has(self, digest, word_ngrams, n):
+        """Returns whether an entry is stored, counting a miss if not"""
+        if self.entry_name(digest, word_ngrams, n) in self.entries:
+            return True
+        self.misses += 1
+        return False
+    
+    def get(self, digest, word_ngrams, n):
+        """Returns the (tokens, freq) table stored for a document, or None.
+        Unreadable entries are deleted and count as misses."""
+        name = self.entry_name(digest, word_ngrams, n)
+        if name not in self.entries:
+            self.misses += 1
+            return None
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, "rb") as f:
+                table = load_table(f.read(), n * unit_width(word_ngrams))
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            self.discard(name)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return table
+    
+    def put(self, digest, word_ngrams, n, tokens, freq):
+        """Stores the count table of a document, then evicts the least
+        recently used entries over max_bytes"""
+        name = self.entry_name(digest, word_ngrams, n)
+        path = os.path.join(self.path, name)
+        data = dump_table(tokens, freq, n * unit_width(word_ngrams))
+        #Write then rename, so readers never see a partial entry
+        partial = "{0}.{1}.tmp".format(path, os.getpid())
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, path)
+        self.size += len(data) - self.entries.pop(name, 0)
+        self.entries[name] = len(data)
+        self.evict()
+    
+    def evict(self):
+        """Deletes the least recently used entries over max_bytes"""
+        while self.size > self.max_bytes and self.entries:
+            self.discard(next(iter(self.entries)))
+    
+    def discard(self, name):
+        """Deletes an entry"""
+        self.size -= self.entries.pop(name, 0)
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+
+
+class TermMatrix(object):
+    """Sparse document x ngram count matrix in CSR form, built by
+    Corpus.term_matrix. Needs NumPy.
+
+    Public attributes:
+    indptr: row i holds entries indptr[i] to indptr[i + 1]
+    indices: column (ngram) of each entry
+    counts: count of each entry
+    terms: list of ngram keys by column, in order of first occurrence
+    doc_ids: list of document ids by row
+    author_rows: dict of author to the slice of rows holding their documents
+    """
+    
+    def __init__(self, indptr, indices, counts, terms, doc_ids, author_rows):
+        self.indptr = indptr
+        self.indices = indices
+        self.counts = counts
+        self.terms = terms
+        self.doc_ids = doc_ids
+        self.author_rows = author_rows
+    
+    @property
+    def shape(self):
+        return len(self.doc_ids), len(self.terms)
+    
+    def view(self, author):
+        """Return the TermMatrix of author's rows. The entry arrays are
+        views of this matrix's; the terms are shared."""
+        rows = self.author_rows[author]
+        start, stop = self.indptr[rows.start], self.indptr[rows.stop]
+        return TermMatrix(self.indptr[rows.start:rows.stop + 1] - start,
+                          self.indices[start:stop], self.counts[start:stop],
+                          self.terms, self.doc_ids[rows],
+                          {author: slice(0, rows.stop - rows.start)})
+    
+    def totals(self):
+        """Returns arrays of the total count and the sum of squared counts
+        of every column over all rows"""
+        size = len(self.terms)
+        #Float sums of integer counts are exact below 2**53
+        total = np.bincount(self.indices, weights=self.counts,
+                            minlength=size)
+        sumsq = np.bincount(self.indices, weights=self.counts ** 2,
+                            minlength=size)
+        if self.counts.dtype.kind == "f":
+            return total, sumsq
+        return total.astype(np.int64), sumsq.astype(np.int64)
+    
+    def stats(self):
+        """Returns arrays of the mean and standard deviation of the count
+        of every column over all rows; rows without it count as zero"""
+        n = len(self.doc_ids)
+        total, sumsq = self.totals()
+        return total / n, np.sqrt(np.maximum(n * sumsq - total * total,
+                                             0)) / n
+    
+    def relative(self):
+        """Returns the TermMatrix of relative frequencies: every count
+        divided by the total count of its row"""
+        lengths = np.diff(self.indptr)
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        row_totals = np.bincount(rows, weights=self.counts,
+                                 minlength=len(lengths))
+        return TermMatrix(self.indptr, self.indices,
+                          self.counts / row_totals[rows], self.terms,
+                          self.doc_ids, self.author_rows)
+    
+    def summary(self, num=20):
+        """Returns {ngram: (mean, std. deviation)} for the top num ngrams
+        over all rows, as NgramStats.summary would for the same documents
+        (ties in order of first occurrence in these rows)"""
+        n = len(self.doc_ids)
+        total, sumsq = self.totals()
+        columns, first = np.unique(self.indices, return_index=True)
+        top = columns[np.lexsort((first, -total[columns]))[:num]]
+        result = {}
+        for c, t, s in zip(top.tolist(), total[top].tolist(),
+                           sumsq[top].tolist()):
+            ss = (n * s - t * t) / n
+            result[self.terms[c]] = (round(t / n, 2), round(stdev(ss, n), 2))
+        return result
+
+
+class DistanceEngine(object):
+    """Scores documents against every author profile at once over a
+    shared feature space: the num ngrams of a TermMatrix with the highest
+    total count (all of them if num is None). Documents are compared by
+    the relative frequencies of the features (counts divided by the
+    document's total count of ngrams), so that long texts do not pull
+    queries towards their authors. Needs NumPy.
+
+    Public attributes:
+    authors: list of authors, in the order of the columns of distances
+    features: list of ngram keys of the feature space
+    profiles: array of each author's mean relative frequency of every
+    feature
+    mean, std: arrays of the mean and standard deviation of the relative
+    frequency of every feature over all documents, used by the "delta"
+    metric
+    """
+    
+    METRICS = ("euclidean", "cosine", "manhattan", "delta")
+    
+    def __init__(self, matrix, num=None):
+        total = matrix.totals()[0]
+        top = np.argsort(-total, kind="stable")[:num]
+        self.features = [matrix.terms[c] for c in top.tolist()]
+        self.columns = {k: i for i, k in enumerate(self.features)}
+        self.authors = list(matrix.author_rows)
+        relative = matrix.relative()
+        self.profiles = np.array([relative.view(a).stats()[0][top]
+                                  for a in self.authors])
+        mean, std = relative.stats()
+        self.mean, self.std = mean[top], std[top]
+    
+    def vectors(self, freqs):
+        """Returns the array of the relative frequencies of every feature
+        in each of a list of dicts of ngram frequencies"""
+        columns = self.columns
+        vectors = np.zeros((len(freqs), len(self.features)))
+        for i, freq in enumerate(freqs):
+            hits = [(columns[k], v) for k, v in freq.items() if k in columns]
+            if hits:
+                cols, counts = zip(*hits)
+                vectors[i, list(cols)] = counts
+                vectors[i] /= sum(freq.values())
+        return vectors
+    
+    def distances(self, freqs, metric="euclidean"):
+        """Returns the array of distances from each of a list of dicts of
+        ngram frequencies (one row each) to every author (one column
+        each, in the order of self.authors)"""
+        if metric not in self.METRICS:
+            raise ValueError("unknown metric {0!r}; choose from {1}".format(
+                             metric, ", ".join(self.METRICS)))
+        q, p = self.vectors(freqs), self.profiles
+        if metric == "delta":
+            #Features with the same count in every document are left out
+            keep = self.std > 0
+            mean, std = self.mean[keep], self.std[keep]
+            q = (q[:, keep] - mean) / std
+            p = (p[:, keep] - mean) / std
+            return manhattan_distances(q, p) / max(int(keep.sum()), 1)
+        if metric == "manhattan":
+            return manhattan_distances(q, p)
+        dots = q @ p.T
+        if metric == "cosine":
+            norms = np.outer(np.linalg.norm(q, axis=1),
+                             np.linalg.norm(p, axis=1))
+            similarity = np.divide(dots, norms, out=np.zeros_like(dots),
+                                   where=norms > 0)
+            #Rounding can take the similarity just past 1
+            return np.clip(1 - similarity, 0, 2)
+        squares = (q * q).sum(1)[:, None] + (p * p).sum(1) - 2 * dots
+        return np.sqrt(np.maximum(squares, 0))
+    
+    def attribute(self, freqs, metric="euclidean"):
+        """Returns the nearest author to each of a list of dicts of ngram
+        frequencies"""
+        nearest = self.distances(freqs, metric).argmin(axis=1)
+        return [self.authors[i] for i in nearest.tolist()]
+
+
+class SuffixIndex(object):
+    """Suffix array and LCP array over the preprocessed units of a list of
+    documents in one tokenisation mode, built by Corpus.build_index.
+    Each document is followed by a separator, a negative unit unique to
+    it, so that no common prefix runs from one document into the next.
+
+    Public attributes:
+    word_ngrams: tokenisation mode of the units
+    units: concatenated units and separators
+    doc_ids: list of document ids, in the order of units
+    doc_of: index in doc_ids of the document of every position
+    suffixes: suffix array, the positions of units in sorted suffix order
+    lcp: lcp[r] is the length of the common prefix of suffixes r - 1 and r
+    """
+    
+    def __init__(self, documents, word_ngrams):
+        """documents is a list of (doc_id, units)"""
+        self.word_ngrams = word_ngrams
+        self.doc_ids = []
+        units, doc_of = array('q'), array('q')
+        for i, (doc_id, doc_units) in enumerate(documents):
+            self.doc_ids.append(doc_id)
+            units.extend(array('q', doc_units))
+            units.append(-1 - i)
+            doc_of.extend(array('q', [i]) * (len(doc_units) + 1))
+        self.units = units
+        self.doc_of = doc_of
+        self.suffixes = suffix_array(units)
+        self.lcp = lcp_array(units, self.suffixes)
+    
+    def key(self, position, n):
+        """Return the packed key of the ngram of length n at position"""
+        bits = 8 * unit_width(self.word_ngrams)
+        key = 0
+        for u in self.units[position:position + n]:
+            key = (key << bits) | u
+        return key
+    
+    def runs(self, n):
+        """Yield (start, stop) of the runs of suffixes sharing an ngram of
+        length n, so that suffixes[start:stop] are its positions"""
+        units, suffixes, lcp = self.units, self.suffixes, self.lcp
+        start = 0
+        for r in range(1, len(suffixes) + 1):
+            if r < len(suffixes) and lcp[r] >= n:
+                continue
+            #A suffix shorter than n reaches its separator; so do all
+            #of its run, which shares its first n units
+            if min(units[suffixes[start]:suffixes[start] + n]) >= 0 \
+               and suffixes[start] + n <= len(units):
+                yield start, r
+            start = r
+    
+    def count(self, units):
+        """Return the number of occurrences of a sequence of units"""
+        target = list(units)
+        n = len(target)
+        suffixes, corpus = self.suffixes, self.units
+        lo, hi = 0, len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if list(corpus[suffixes[mid]:suffixes[mid] + n]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if list(corpus[suffixes[mid]:suffixes[mid] + n]) <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - first
+    
+    def frequent(self, n, min_count=2):
+        """Returns {ngram: count} for every ngram of length n occurring at
+        least min_count times, in sorted order of their units"""
+        return {self.key(self.suffixes[start], n): stop - start
+                for start, stop in self.runs(n) if stop - start >= min_count}
+    
+    def summary(self, doc_ids, n, num=20):
+        """Returns {ngram: (mean, std. deviation)} for the top num ngrams
+        of length n over the documents doc_ids, as NgramStats.summary
+        would: ties go to the ngram occurring first, documents in index
+        order"""
+        member = bytearray(len(self.doc_ids))
+        rows = {d: i for i, d in enumerate(self.doc_ids)}
+        for d in doc_ids:
+            member[rows[d]] = 1
+        suffixes, doc_of = self.suffixes, self.doc_of
+        found = []
+        for start, stop in self.runs(n):
+            positions = [p for p in suffixes[start:stop]
+                         if member[doc_of[p]]]
+            if positions:
+                found.append((len(positions), -min(positions), start, stop))
+        num_docs = len(doc_ids)
+        result = {}
+        for total, first, start, stop in heapq.nlargest(num, found):
+            per_doc = collections.Counter(doc_of[p] for p
+                                          in suffixes[start:stop]
+                                          if member[doc_of[p]])
+            sumsq = sum(v * v for v in per_doc.values())
+            ss = (num_docs * sumsq - total * total) / num_docs
+            result[self.key(-first, n)] = (round(total / num_docs, 2),
+                                           round(stdev(ss, num_docs), 2))
+        return result
+
+
+class Instrumentation(object):
+    """Per-stage totals of time and work, kept by a Corpus after
+    Corpus.instrument. Stages are "preprocess", "count", "set_model",
+    "summarise" and "compute_distance". "count" of a streamed Document
+    includes its preprocessing, and Documents counted in worker
+    processes are only seen through "set_model".
+
+    Public attributes:
+    stages: dict of stage name to a dict of totals: calls, wall and cpu
+            (seconds), documents, chars (characters of text), ngrams
+            (windows counted or ngrams returned) and keys (distinct
+            ngrams)
+    hook: function called as hook(stage, record) with the figures of
+          each single call, or None
+    """
+    
+    FIELDS = ("calls", "wall", "cpu", "documents", "chars", "ngrams", "keys")
+    
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.stages = {}
+    
+    def __str__(self):
+        output = "Stage\t\t\tcalls\twall\tcpu\tdocs\tchars\tngrams\tkeys\n"
+        for stage, totals in self.stages.items():
+            output += "{0:<16}\t{calls}\t{wall:.3f}\t{cpu:.3f}\t{documents}" \
+                      "\t{chars}\t{ngrams}\t{keys}\n".format(stage, **totals)
+        return output
+    
+    def start(self):
+        """Return the (wall, cpu) clocks to pass to record"""
+        return time.perf_counter(), time.process_time()
+    
+    def record(self, stage, started, **counts):
+        """Add one call of stage, begun at started (see start), with
+        counts of any of FIELDS"""
+        wall, cpu = started
+        record = {"wall": time.perf_counter() - wall,
+                  "cpu": time.process_time() - cpu}
+        record.update(counts)
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = dict.fromkeys(self.FIELDS, 0)
+        totals["calls"] += 1
+        for k, v in record.items():
+            totals[k] += v
+        if self.hook is not None:
+            self.hook(stage, record)
+    
+    def reset(self):
+        self.stages = {}
+
+
+class FileSource(object):
+    """Opens a text file on disk for a streamed Document"""
+    
+    def __init__(self, path, encoding="utf-8"):
+        self.path = path
+        self.encoding = encoding
+    
+    def __str__(self):
+        return self.path
+    
+    def open(self):
+        return open(self.path, 'r', encoding=self.encoding)
+    
+    def read(self):
+        """Return the whole text"""
+        with self.open() as f:
+            return f.read()
+
+
+class CompressedFileSource(FileSource):
+    """Opens a single gzip, bz2 or xz compressed text file"""
+    
+    def open(self):
+        ext = os.path.splitext(self.path)[1].lower()
+        module = import_module(COMPRESSED_MODULES[ext])
+        return module.open(self.path, 'rt', encoding=self.encoding)
+
+
+class ZipMemberSource(FileSource):
+    """Opens one member of a zip archive, without extracting it"""
+    
+    def __init__(self, path, member, encoding="utf-8"):
+        FileSource.__init__(self, path, encoding)
+        self.member = member
+    
+    def __str__(self):
+        return "{0}:{1}".format(self.path, self.member)
+    
+    def open(self):
+        archive = zipfile.ZipFile(self.path)
+        try:
+            raw = archive.open(self.member)
+        except Exception:
+            archive.close()
+            raise
+        return ArchiveText(raw, archive, self.encoding)
+
+
+class TarMemberSource(ZipMemberSource):
+    """Opens one member of a (possibly compressed) tar archive"""
+    
+    def open(self):
+        archive = tarfile.open(self.path)
+        try:
+            raw = archive.extractfile(self.member)
+        except Exception:
+            archive.close()
+            raise
+        return ArchiveText(raw, archive, self.encoding)
+
+
+class PackedSource(FileSource):
+    """Opens one document of a packed corpus (see Corpus.pack): a byte
+    range of the memory-mapped texts file. Only the path and range are
+    pickled, so worker processes map the file themselves."""
+    
+    def __init__(self, path, start, stop, encoding="utf-8"):
+        FileSource.__init__(self, path, encoding)
+        self.start = start
+        self.stop = stop
+    
+    def __str__(self):
+        return "{0}[{1}:{2}]".format(self.path, self.start, self.stop)
+    
+    def view(self):
+        """Return a zero-copy memoryview of the document's bytes"""
+        return memoryview(map_file(self.path))[self.start:self.stop]
+    
+    def open(self):
+        return io.TextIOWrapper(io.BufferedReader(MappedRange(self.view())),
+                                encoding=self.encoding)
+    
+    def read(self):
+        return str(self.view(), self.encoding)
+
+
+class ArchiveText(io.TextIOWrapper):
+    """Text stream over an archive member that also closes the archive"""
+    
+    def __init__(self, raw, archive, encoding):
+        io.TextIOWrapper.__init__(self, raw, encoding=encoding)
+        self.archive = archive
+    
+    def close(self):
+        try:
+            io.TextIOWrapper.close(self)
+        finally:
+            self.archive.close()
+
+
+class MappedRange(io.RawIOBase):
+    """Readable binary stream over a memoryview, without copying it"""
+    
+    def __init__(self, view):
+        io.RawIOBase.__init__(self)
+        self.view = view
+        self.pos = 0
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, b):
+        size = min(len(b), len(self.view) - self.pos)
+        b[:size] = self.view[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+
+#Read-only memory maps of packed texts files in this process, by path
+_mapped_files = {}
+
+
+def map_file(path):
+    """Return a read-only memory map of a file, shared by every
+    PackedSource of this process (an empty file maps to b"")"""
+    if path not in _mapped_files:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                _mapped_files[path] = mmap.mmap(f.fileno(), 0,
+                                                access=mmap.ACCESS_READ)
+            else:
+                _mapped_files[path] = b""
+    return _mapped_files[path]
+
+
+def iter_texts(path, encoding="utf-8"):
+    """Yield (name, source, read) for every file in path, which may be a
+    directory, a zip or tar archive, or a single (compressed) file.
+    name is the file's path within the directory or archive, source can
+    reopen it later, and read() returns its text while the iteration is
+    on that file, without reopening the archive."""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for file in sorted(files):
+                full = os.path.join(root, file)
+                name = os.path.relpath(full, path).replace(os.sep, "/")
+                source = FileSource(full, encoding)
+                yield name, source, source.read
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                read = lambda: io.TextIOWrapper(archive.open(info),
+                                                encoding=encoding).read()
+                yield (info.filename, ZipMemberSource(path, info.filename,
+                                                      encoding), read)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                read = lambda: io.TextIOWrapper(archive.extractfile(member),
+                                                encoding=encoding).read()
+                #Archives made with "tar -C dir ." prefix every name
+                name = member.name[2:] if member.name.startswith("./") \
+                       else member.name
+                yield name, TarMemberSource(path, member.name, encoding), read
+    else:
+        root, ext = os.path.splitext(path)
+        if ext.lower() in COMPRESSED_MODULES:
+            source = CompressedFileSource(path, encoding)
+            path = root
+        else:
+            source = FileSource(path, encoding)
+        yield os.path.basename(path), source, source.read
+
+
+def matches(name, patterns):
+    """True if name, or just its file name, matches any glob pattern"""
+    base = name.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(base, p)
+               for p in patterns)
+
+
+def author_from_filename(name):
+    """Default author id: the first character of the file name"""
+    return name.rsplit("/", 1)[-1][:1]
+
 
 class Document(object):
     """Represents a document used by the Corpus class.
 
     Public attributes:
-    text: container for text
+    text: container for the raw text, never modified
+    preprocessed: dict of encoded units (see encode) of the preprocessed
+                  text, cached per word_ngrams mode
     word_ngrams: boolean used in create_ngrams method to create
                  words (True) or char-ngrams (False)
     ngram_len = defines length of returned ngrams (in words or chars)
-    ngram_freq = dict of frequency counts for ngrams in document
+    ngram_freq = dict of frequency counts for ngrams in document,
+                 keyed by packed ints (see decode)
     ngram_list = list of ngrams
+    vocabulary = Vocabulary used to encode words, normally shared
+                 with the Corpus
+    source = object with an open() method returning a text file, for
+             documents streamed in CHUNK_SIZE pieces (text is then None)
+    stats = Instrumentation recording preprocess and count, or None
+    counts_only = when True neither the list of ngrams nor the
+                  preprocessed units are kept: only the counts are, and
+                  iter_ngrams regenerates ngrams when they are wanted
     """
     #Modify punctuation to stop removal of hyphens, but include smart quotes
     PUNCT = (string.punctuation).replace("-", "") + "’‘“”"
     #Compile regexes for words and chars and set as constant
     WORD_REGEX = re.compile('[%s]' % re.escape(PUNCT))
     CHAR_REGEX = re.compile('[%s]' % re.escape("\r\n\t"))
+    #Counting engines selectable in set_ngrams, mapped to method names
+    ENGINES = {"python": "count_orders", "rolling": "count_rolling",
+               "numpy": "count_numpy"}
+    #Characters read at a time from the source of a streamed document
+    CHUNK_SIZE = 1 << 20
+    #A Corpus holds many Documents: no per-instance __dict__
+    __slots__ = ("text", "source", "stats", "doc_id", "vocabulary",
+                 "ngram_len", "word_ngrams", "preprocessed", "ngrams",
+                 "ngram_freq", "ngram_freqs", "counts_only")
     
-    def __init__(self, text, doc_id):
+    def __init__(self, text, doc_id, vocabulary=None, source=None,
+                 stats=None, counts_only=False):
+        if text is None and source is None:
+            raise ValueError("a Document needs either text or a source")
         self.text = text
+        self.source = source
+        self.stats = stats
         self.doc_id = doc_id
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
         self.ngram_len = 0
         self.word_ngrams = False
+        self.preprocessed = {}
+        self.ngrams = []
+        self.ngram_freq = {}
+        self.ngram_freqs = {}
+        self.counts_only = counts_only
        
     
     def __str__(self):
         output = """Document():\n
         Doc id: {0}\n
-        Text: {1} {2}\n""".format(self.doc_id, self.text[:100], "...")
-        if self.ngrams:
+        Text: {1} {2}\n""".format(self.doc_id,
+                                   self.text[:100] if self.text is not None
+                                   else "<streamed from {0}>".format(
+                                       self.source), "...")
+        if self.ngram_freq:
+            n = self.ngram_len
+            sample = {self.decode(k, n): v
+                      for k, v in list(self.ngram_freq.items())[:20]}
+            first = self.ngrams[:5] or list(
+                itertools.islice(self.iter_ngrams(n), 5))
             output += """N-grams: {0} {2}\n
-        N-gram freqs: {1} {2}""".format(self.ngrams[:5],
-                                        str(self.ngram_freq)[:100], "...")
+        N-gram freqs: {1} {2}""".format([self.decode(k, n)
+                                         for k in first],
+                                        str(sample)[:100], "...")
         return output
     
     
     def preprocess_document(self, word_ngrams):
+        """Return the encoded units of the text preprocessed for
+        word_ngrams (see clean_text).
+        self.text is not modified: the result is cached in
+        self.preprocessed, so a later call for the same mode does no
+        work and the two modes never see each other's output. In
+        counts_only mode nothing is cached."""
+        self.word_ngrams = word_ngrams
+        units = self.preprocessed.get(word_ngrams)
+        if units is None:
+            if self.text is None:
+                #Streamed documents are not cached: that would hold the
+                #whole text in memory
+                units = array('I')
+                for chunk in self.stream_units():
+                    units.extend(chunk)
+                return units
+            if self.stats is not None:
+                started = self.stats.start()
+            units = self.encode(self.clean_text(self.text))
+            if self.stats is not None:
+                self.stats.record("preprocess", started, documents=1,
+                                  chars=len(self.text))
+            if not self.counts_only:
+                self.preprocessed[word_ngrams] = units
+        return units
+    
+    def clean_text(self, strng):
         """Strip punctuation when word_ngrams is True,
         else return string"""
-        self.word_ngrams = word_ngrams
-        strng = self.text
         #strng = strng.lower() - 
         if self.word_ngrams: 
-               strng_no_punc = self.WORD_REGEX.sub('', strng).split()
-               #Strip hyphens at end of words
-               strng_no_punc = (s.strip('-') for s in strng_no_punc)
-               #Remove double hyphens used in Gutenberg files
-               strng_no_punc = (s.replace("--", " ") for s in strng_no_punc)
                #Recreate string
-               self.text = " ".join(strng_no_punc)
+               return " ".join(self.clean_words(strng))
         else:
-               strng = self.CHAR_REGEX.sub(" ", strng)
-               self.text = strng
+               return self.CHAR_REGEX.sub(" ", strng)
+    
+    def clean_words(self, strng):
+        """Return the list of punctuation-stripped words that clean_text
+        joins in word mode"""
+        strng_no_punc = self.WORD_REGEX.sub('', strng).split()
+        #Strip hyphens at end of words
+        strng_no_punc = (s.strip('-') for s in strng_no_punc)
+        #Remove double hyphens used in Gutenberg files
+        return [s.replace("--", " ") for s in strng_no_punc]
+    
+    def stream_units(self):
+        """Yield the encoded units of the preprocessed text of
+        self.source, reading CHUNK_SIZE characters at a time.
+        Concatenated, the chunks equal preprocess_document's result.
+        In word mode a word cut by the end of a chunk is held back and
+        joined to the start of the next one."""
+        carry = ""
+        seen_words = False
+        with self.source.open() as f:
+            while True:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not self.word_ngrams:
+                    if not chunk:
+                        break
+                    yield self.encode(self.clean_text(chunk))
+                    continue
+                tokens = (carry + chunk).split()
+                carry = ""
+                if chunk and tokens and not chunk[-1].isspace():
+                    carry = tokens.pop()
+                words = self.clean_words(" ".join(tokens))
+                if words:
+                    seen_words = True
+                    yield self.encode(" ".join(words))
+                if not chunk:
+                    break
+        #An empty text still has one empty word, as " ".join([]) does
+        if self.word_ngrams and not seen_words:
+            yield self.encode("")
+    
+    def count_stream(self, orders, count):
+        """Count ngrams of every length in orders over the streamed
+        chunks with the engine method count.
+        Each chunk is counted together with the last (longest order - 1)
+        units of the one before, so that windows spanning the boundary
+        are included; windows wholly inside that overlap were counted
+        last time and are subtracted again."""
+        freqs = {n: {} for n in orders}
+        keep = orders[-1] - 1
+        overlap = array('I')
+        for chunk in self.stream_units():
+            units = overlap + chunk
+            for n, freq in count(orders, units).items():
+                total = freqs[n]
+                for k, v in freq.items():
+                    total[k] = total.get(k, 0) + v
+            if len(overlap) >= orders[0]:
+                for n, freq in count(orders, overlap).items():
+                    total = freqs[n]
+                    for k, v in freq.items():
+                        total[k] -= v
+            overlap = units[max(len(units) - keep, 0):] if keep else array('I')
+        self.ngrams = []
+        return freqs
         
     
     def create_ngrams(self, n, t):
@@ -114,13 +1631,33 @@ class Document(object):
         Boolean attribute self.word_ngrams provides switch
         between word (True), or character (False)"""
         self.ngrams = ""
-        t = t.replace(" ", "_")
-        if self.word_ngrams:
-            t = t.split("_") 
+        t = self.tokenise(t)
         ngrams = [", ".join(t[i:i+n]) for i in range(len(t)-n+1)]
         return ngrams
+    
+    def tokenise(self, t):
+        """Split t into the units ngrams are built from: a list of words
+        when self.word_ngrams is True, else a string of characters"""
+        t = t.replace(" ", "_")
+        if self.word_ngrams:
+            t = t.split("_")
+        return t
         
+    def encode(self, t):
+        """Return the units of t as an array of ints: code points for
+        chars, or vocabulary ids for words"""
+        t = self.tokenise(t)
+        if self.word_ngrams:
+            return array('I', self.vocabulary.encode(t))
+        units = array('I')
+        units.frombytes(t.encode(NATIVE_UTF32, "surrogatepass"))
+        return units
     
+    def decode(self, key, n=None):
+        """Return the readable form of a packed ngram key of length n"""
+        return decode_ngram(key, n or self.ngram_len, self.word_ngrams,
+                            self.vocabulary)
+        
     def count_freq(self):
         """Generate dictionary with frequency of ngrams"""
         freq  = {}
@@ -128,22 +1665,304 @@ class Document(object):
             freq[n] = freq.get(n, 0) + 1
         return freq
     
-    def set_ngrams(self, ngram_len):
-        """Wrapper function to create and count ngrams of n-length"""
-        self.ngrams = self.create_ngrams(ngram_len, self.text)
-        self.ngram_freq = self.count_freq()
+    def count_orders(self, orders, units):
+        """Generate a dictionary of ngram frequencies for every length in
+        orders with a single pass over the encoded units.
+        Orders must be sorted ascending. self.ngrams is only filled when
+        a single length is counted, and not in counts_only mode."""
+        width = unit_width(self.word_ngrams)
+        freqs = {n: {} for n in orders}
+        first, last = orders[0], orders[-1]
+        self.ngrams = ngrams = []
+        keep = not self.counts_only
+        if first == last:
+            #Single length: each key is one slice of the packed buffer
+            buf = pack_units(units, width)
+            size = first * width
+            freq = freqs[first]
+            from_bytes = int.from_bytes
+            for start in range(0, (len(units) - first + 1) * width, width):
+                key = from_bytes(buf[start:start + size], "big")
+                freq[key] = freq.get(key, 0) + 1
+                if keep:
+                    ngrams.append(key)
+            return freqs
+        #Several lengths: extend the key of each window one unit at a
+        #time and record it at every requested length
+        bits = 8 * width
+        tables = [freqs.get(n) for n in range(1, last + 1)]
+        for i in range(len(units) - first + 1):
+            key = 0
+            for u, freq in zip(units[i:i + last], tables):
+                key = (key << bits) | u
+                if freq is not None:
+                    freq[key] = freq.get(key, 0) + 1
+        return freqs
+    
+    def count_rolling(self, orders, units):
+        """Same counts as count_orders, using a rolling hash.
+        Rabin-Karp style, each window's key is rolled from the previous
+        window's by shifting in the next unit and masking off the oldest,
+        so a window costs O(1) whatever its length. The base is 2**bits
+        with no modulus, which makes the hash the packed key itself:
+        distinct ngrams can never collide.
+        The longest order is rolled; shorter orders ending at the same
+        unit are its low bits."""
+        bits = 8 * unit_width(self.word_ngrams)
+        freqs = {n: {} for n in orders}
+        self.ngrams = ngrams = []
+        keep = not self.counts_only
+        last = orders[-1]
+        mask = (1 << (bits * last)) - 1
+        key = 0
+        if len(orders) == 1:
+            freq = freqs[last]
+            for u in units[:last - 1]:
+                key = (key << bits) | u
+            for u in units[last - 1:]:
+                key = ((key << bits) | u) & mask
+                freq[key] = freq.get(key, 0) + 1
+                if keep:
+                    ngrams.append(key)
+            return freqs
+        tables = [(n - 1, (1 << (bits * n)) - 1, freqs[n]) for n in orders]
+        for j, u in enumerate(units):
+            key = ((key << bits) | u) & mask
+            for start, order_mask, freq in tables:
+                #Orders are ascending, so none longer has a full window yet
+                if j < start:
+                    break
+                k = key & order_mask
+                freq[k] = freq.get(k, 0) + 1
+        return freqs
+    
+    def count_numpy(self, orders, units):
+        """Same counts as count_orders, vectorised with NumPy.
+        Units are renumbered 1, 2, ... in code point (or id) order, so
+        a unit takes only as many bits as the alphabet of the text
+        needs, and the windows of the longest order are packed into as
+        few uint64 columns as hold them (one for up to 9 units of an
+        ASCII text). Windows running off the end are padded with 0,
+        below every unit. A single lexsort of the columns then sorts the
+        windows of every order at once, since a window's prefixes sort
+        with it: the ngrams of length n are the runs of sorted windows
+        whose first n units agree. Packed keys are only built for
+        distinct ngrams, from their first occurrence, and are kept in
+        that order as the dict loop would have left them. Keys of up to
+        8 bytes are packed as uint64s; longer ones are read from the
+        packed buffer through a strided view.
+        Falls back to count_orders when NumPy is not installed."""
+        if np is None:
+            return self.count_orders(orders, units)
+        width = unit_width(self.word_ngrams)
+        freqs = {n: {} for n in orders}
+        self.ngrams = []
+        size = len(units)
+        if size < orders[0]:
+            return freqs
+        buf = pack_units(units, width)
+        units = np.frombuffer(units, dtype=np.uint32)
+        alphabet, codes = np.unique(units, return_inverse=True)
+        codes = codes.ravel().astype(np.uint64) + np.uint64(1)
+        bits = len(alphabet).bit_length()
+        last = orders[-1]
+        padded = np.concatenate((codes, np.zeros(last - 1, np.uint64)))
+        #(first unit, units held, column) for each uint64 column
+        per = max(64 // bits, 1)
+        columns = []
+        for start in range(0, last, per):
+            held = min(per, last - start)
+            column = padded[start:start + size].copy()
+            for j in range(start + 1, start + held):
+                column <<= np.uint64(bits)
+                column |= padded[j:j + size]
+            columns.append((start, held, column))
+        order = np.lexsort([column for _, _, column in reversed(columns)])
+        columns = [(start, held, column[order])
+                   for start, held, column in columns]
+        keep = len(orders) == 1 and not self.counts_only
+        from_bytes = int.from_bytes
+        for n in orders:
+            count = size - n + 1
+            if count <= 0:
+                break
+            change = np.zeros(size, dtype=bool)
+            change[0] = True
+            for start, held, column in columns:
+                if start >= n:
+                    break
+                used = min(n - start, held)
+                column = column >> np.uint64(bits * (held - used))
+                change[1:] |= column[1:] != column[:-1]
+            starts = np.flatnonzero(change)
+            counts = np.diff(np.append(starts, size))
+            first = np.minimum.reduceat(order, starts)
+            #Runs of padded windows start at or after count
+            valid = np.flatnonzero(first < count)
+            by_first = valid[np.argsort(first[valid])]
+            size_n = n * width
+            if size_n <= 8:
+                #Keys that fit in a uint64 are packed here in one go
+                keys = np.zeros(len(by_first), dtype=np.uint64)
+                for j in range(n):
+                    keys <<= np.uint64(8 * width)
+                    keys |= units[first[by_first] + j]
+                keys = keys.tolist()
+            else:
+                #Each window as a bytes object, read through a strided
+                #view of the packed buffer
+                windows = np.ndarray((count,), np.dtype((np.void, size_n)),
+                                     buf, strides=(width,))
+                keys = list(map(from_bytes, windows[first[by_first]].tolist(),
+                                itertools.repeat("big")))
+            freqs[n] = dict(zip(keys, counts[by_first].tolist()))
+            if keep:
+                rank = np.empty(len(starts), dtype=np.int64)
+                rank[by_first] = np.arange(len(keys))
+                position = np.empty(size, dtype=np.int64)
+                position[order] = rank[np.cumsum(change) - 1]
+                self.ngrams = list(map(keys.__getitem__,
+                                       position[:count].tolist()))
+        return freqs
+    
+    def set_ngrams(self, ngram_len, engine="python"):
+        """Wrapper function to create and count ngrams of n-length.
+        ngram_len may be a single length or an iterable of lengths, in
+        which case every length is counted in one pass and kept in
+        self.ngram_freqs keyed by length. self.ngram_freq holds the counts
+        for the shortest length, and self.ngrams is left empty.
+        engine names the counting method in ENGINES; all engines give
+        identical counts."""
+        if engine not in self.ENGINES:
+            raise ValueError("unknown engine {0!r}; choose from {1}".format(
+                             engine, ", ".join(sorted(self.ENGINES))))
+        count = getattr(self, self.ENGINES[engine])
+        orders = ngram_orders(ngram_len)
+        self.ngram_len = orders[0]
+        stats = self.stats
+        if self.text is None:
+            if stats is not None:
+                started = stats.start()
+            self.ngram_freqs = self.count_stream(orders, count)
+        else:
+            units = self.preprocess_document(self.word_ngrams)
+            if stats is not None:
+                started = stats.start()
+            self.ngram_freqs = count(orders, units)
+        if stats is not None:
+            freqs = self.ngram_freqs.values()
+            stats.record("count", started, documents=1,
+                         ngrams=sum(sum(f.values()) for f in freqs),
+                         keys=sum(len(f) for f in freqs))
+        self.ngram_freq = self.ngram_freqs[self.ngram_len]
+    
+    def set_counts(self, ngram_freqs):
+        """Install ngram frequencies counted elsewhere (e.g. by
+        count_table in a worker process), keyed by length and encoded
+        with self.vocabulary"""
+        self.ngram_freqs = ngram_freqs
+        self.ngram_len = min(ngram_freqs)
+        self.ngram_freq = ngram_freqs[self.ngram_len]
+        self.ngrams = []
+    
+    def iter_ngrams(self, n=None):
+        """Yield the packed keys of the ngrams of length n (default
+        self.ngram_len) of the preprocessed text in order, one window at
+        a time, without building a list of them"""
+        n = n or self.ngram_len
+        bits = 8 * unit_width(self.word_ngrams)
+        mask = (1 << (bits * n)) - 1
+        if self.text is None:
+            chunks = self.stream_units()
+        else:
+            chunks = (self.preprocess_document(self.word_ngrams),)
+        key, seen = 0, 0
+        for chunk in chunks:
+            for u in chunk:
+                key = ((key << bits) | u) & mask
+                seen += 1
+                if seen >= n:
+                    yield key
+    
+    def get_ngram(self, i, n=None, word_ngrams=None):
+        """Return the i-th ngram of length n (default self.ngram_len)
+        of the preprocessed text, without regenerating the whole list.
+        word_ngrams selects the mode to read (default: the current one)
+        without changing it."""
+        n = n or self.ngram_len
+        if word_ngrams is not None and word_ngrams != self.word_ngrams:
+            self.word_ngrams = word_ngrams
+            try:
+                return self.get_ngram(i, n)
+            finally:
+                self.word_ngrams = not word_ngrams
+        if self.text is None:
+            #Read only as far into the stream as the ngram
+            units = array('I')
+            for chunk in self.stream_units():
+                units.extend(chunk)
+                if len(units) >= i + n:
+                    break
+        else:
+            units = self.preprocess_document(self.word_ngrams)
+        if not 0 <= i <= len(units) - n:
+            raise IndexError("ngram index out of range")
+        bits = 8 * unit_width(self.word_ngrams)
+        key = 0
+        for u in units[i:i + n]:
+            key = (key << bits) | u
+        return self.decode(key, n)
     
     
 class Corpus:
     """Container class to hold Documents, and provides methods to insert 
     documents and to summarise by defined author.
+    Documents inserted, removed or replaced after set_model are counted
+    under the current model on their own, and the accumulated counts of
+    their author are updated in place.
+    cache is an optional CountCache consulted by set_model.
+    stats is None, or the Instrumentation set up by instrument.
+    counts_only is passed to every Document (see Document).
+    features is None, or {ngram_len: set of keys} kept by prune; Documents
+    counted later keep only those keys too.
+    stop_keys is None, or {ngram_len: set of keys} of the stop list given
+    to set_model, dropped from every Document's counts.
+    stop_pending is the list of stop ngrams with words not yet in the
+    vocabulary.
     """
     
-    def __init__(self):
+    def __init__(self, cache=None, counts_only=False):
+        self.cache = cache
+        self.counts_only = counts_only
+        self.stats = None
         self.documents = {}
         self.summary = {}
+        #(ngram_len, word_ngrams) each summary was made with, for decoding
+        self.summary_params = {}
+        #Next document id; ids of removed Documents are not reused
         self.doc_count = 0
         self.author_docs = {}
+        self.doc_authors = {}
+        #NgramStats per author and ngram length, built by summarise
+        self.author_stats = {}
+        self.ngram_lens = ()
+        self.word_ngrams = False
+        self.engine = "python"
+        #SuffixIndex made by build_index, dropped when Documents change
+        self.index = None
+        #SketchStats arguments or HeavyHitters capacity in approximate
+        #mode (see set_model)
+        self.sketch = None
+        self.heavy_hitters = None
+        #Number each Document was added to its author's SketchStats or
+        #HeavyHitters with
+        self.doc_numbers = {}
+        self.features = None
+        self.stop_keys = None
+        self.stop_pending = []
+        #Size of the vocabulary when stop_pending was last tried
+        self.stop_vocab_size = 0
+        self.vocabulary = Vocabulary()
  
     def __str__(self):
         output = "Corpus()\nAuthor \t\tNumber of documents"
@@ -158,205 +1977,977 @@ class Corpus:
             output += self.print_summary()
         return output
 
-    def load_corpus(self, path= None, exclusion_list=None):    
+    def load_corpus(self, path= None, exclusion_list=None, stream=False,
+                    include=("*.txt",), exclude=(),
+                    author_id=author_from_filename, encoding="utf-8"):    
         """Returns a Corpus of Document objects based sample texts.
         Variables:
-        path : path to folder of files
+        path : path to folder of files, or to a zip/tar archive or a
+        single .gz/.bz2/.xz file (default: the current directory).
+        Archives are read in place, never extracted.
         exclusion_list: a list of files to be excluded from inclusion
-        in corpus."""
-
-        files_to_load = glob.glob("*")
-        for file in files_to_load:
-            if (".txt" in file) and (file not in exclusion_list):
-                with open(file, 'r', encoding="utf-8") as f:
-                    text = f.read()
-                    author_id = file[:1]
-                    corpus.insert_document(text, author_id)
-        return corpus
-    
-    def insert_document(self, text, author):
+        in corpus.
+        stream: if True, files are not read now; each Document streams
+        its file in chunks whenever set_model counts it. (Each pass then
+        reopens the archive, which is slow for compressed tars.)
+        include, exclude: glob patterns matched against each file's path
+        within path, or its file name.
+        author_id: function of the file's path returning its author."""
+
+        exclude = tuple(exclude) + tuple(exclusion_list or ())
+        for name, source, read in iter_texts(path or os.curdir, encoding):
+            if not matches(name, include) or matches(name, exclude):
+                continue
+            if stream:
+                self.insert_document(None, author_id(name), source)
+            else:
+                self.insert_document(read(), author_id(name))
+        return self
+    
+    def pack(self, path):
+        """Writes the texts of all Documents, in document order, to a
+        packed corpus: path holds them as one UTF-8 file, and
+        path + ".idx" the byte range and author of each (see
+        open_packed)"""
+        documents = []
+        offset = 0
+        with open(path, "wb") as blob:
+            for doc_id, doc in self.documents.items():
+                if doc.text is not None:
+                    size = blob.write(doc.text.encode("utf-8"))
+                else:
+                    size = 0
+                    with doc.source.open() as f:
+                        for chunk in iter(lambda: f.read(doc.CHUNK_SIZE), ""):
+                            size += blob.write(chunk.encode("utf-8"))
+                documents.append([offset, offset + size,
+                                  self.doc_authors[doc_id]])
+                offset += size
+        with open(path + ".idx", "w", encoding="utf-8") as f:
+            json.dump({"format": "ngrammer-pack", "version": 1,
+                       "encoding": "utf-8", "documents": documents}, f)
+    
+    def open_packed(self, path):
+        """Inserts the Documents of a packed corpus written by pack. Only
+        the index is read now: each Document streams its text from a
+        read-only memory map of path when set_model counts it."""
+        with open(path + ".idx", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("format") != "ngrammer-pack":
+            raise ValueError("{0}.idx is not a packed corpus index".format(
+                             path))
+        for start, stop, author in index["documents"]:
+            self.insert_document(None, author, PackedSource(
+                path, start, stop, index["encoding"]))
+        return self
+    
+    def insert_document(self, text, author, source=None):
         """This is a wrapper function takes a text file, instantiates a 
-        Document object"""
-        doc = Document(text, self.doc_count)
-        self.documents.update({self.doc_count: doc})
+        Document object and returns its id.
+        text may be None if source is given (see Document)."""
+        doc_id = self.doc_count
+        doc = Document(text, doc_id, self.vocabulary, source, self.stats,
+                       self.counts_only)
+        self.documents.update({doc_id: doc})
         #Create/update dictionary to key on author        
         if author not in self.author_docs.keys():
-            self.author_docs.update({author: [self.doc_count]})
+            self.author_docs.update({author: [doc_id]})
         else:
-            self.author_docs[author].append(self.doc_count)
+            self.author_docs[author].append(doc_id)
+        self.doc_authors[doc_id] = author
         self.doc_count += 1
+        self.index = None
+        if self.ngram_lens:
+            self.count_document(doc)
+            self.update_stats(author, doc, "add")
+        return doc_id
+    
+    def remove_document(self, doc_id):
+        """Removes a Document from the corpus and its counts from its
+        author's accumulated counts. Returns the Document."""
+        doc = self.documents.pop(doc_id)
+        author = self.doc_authors.pop(doc_id)
+        self.index = None
+        self.author_docs[author].remove(doc_id)
+        if not self.author_docs[author]:
+            del self.author_docs[author]
+            self.author_stats.pop(author, None)
+            self.doc_numbers.pop(doc_id, None)
+            self.summary.pop(author, None)
+            self.summary_params.pop(author, None)
+        elif self.ngram_lens:
+            self.update_stats(author, doc, "remove")
+        return doc
+    
+    def replace_document(self, doc_id, text, source=None):
+        """Replaces the text of a Document, keeping its id and author,
+        and recounts only that Document"""
+        author = self.doc_authors[doc_id]
+        old = self.documents[doc_id]
+        doc = Document(text, doc_id, self.vocabulary, source, self.stats,
+                       self.counts_only)
+        self.documents[doc_id] = doc
+        self.index = None
+        if self.ngram_lens:
+            self.count_document(doc)
+            self.update_stats(author, old, "remove")
+            self.update_stats(author, doc, "add")
+    
+    def instrument(self, hook=None, enabled=True):
+        """Starts recording per-stage timings and counts in a new
+        Instrumentation, self.stats, which is returned. hook is passed to
+        it. enabled=False stops recording and sets self.stats to None."""
+        self.stats = Instrumentation(hook) if enabled else None
+        for doc in self.documents.values():
+            doc.stats = self.stats
+        return self.stats
+    
+    def count_document(self, doc):
+        """Counts one Document under the current model"""
+        doc.word_ngrams = self.word_ngrams
+        doc.set_ngrams(self.ngram_lens, self.engine)
+        if self.features or self.stop_keys is not None:
+            self.filter_counts(doc)
+    
+    def filter_counts(self, doc):
+        """Drops the keys not in self.features, and those in
+        self.stop_keys, from one Document's counts. Stop ngrams with
+        words the vocabulary lacked are retried once it has grown."""
+        if self.stop_pending and len(self.vocabulary) != self.stop_vocab_size:
+            self.stop_pending = self.stop_ngrams(self.stop_pending)
+        features = self.features or {}
+        stop_keys = self.stop_keys or {}
+        freqs = doc.ngram_freqs
+        for n, freq in freqs.items():
+            keep = features.get(n)
+            if keep is not None:
+                freq = {k: v for k, v in freq.items() if k in keep}
+            stop = stop_keys.get(n)
+            if stop:
+                freq = {k: v for k, v in freq.items() if k not in stop}
+            freqs[n] = freq
+        doc.ngram_freq = freqs.get(doc.ngram_len, {})
     
+    def stop_ngrams(self, stop):
+        """Add the keys of the ngrams in stop that are of a length the
+        model counts to self.stop_keys, and return a list of those that
+        cannot be encoded yet. Each is a string tokenised as the texts
+        are: space-separated words for word ngrams, else characters with
+        spaces written as "_". A word ngram with a word not in the
+        vocabulary cannot match any count so far: it is returned rather
+        than added to the vocabulary, and filter_counts retries it."""
+        width = unit_width(self.word_ngrams)
+        ids = self.vocabulary.ids
+        self.stop_vocab_size = len(self.vocabulary)
+        keys = self.stop_keys
+        pending = []
+        for ngram in stop:
+            if self.word_ngrams:
+                units = [ids.get(word) for word in ngram.split()]
+                if None in units:
+                    pending.append(ngram)
+                    continue
+            else:
+                units = [ord(c) for c in ngram.replace(" ", "_")]
+            if len(units) in self.ngram_lens:
+                key = int.from_bytes(pack_units(units, width), "big")
+                keys.setdefault(len(units), set()).add(key)
+        return pending
     
-    def set_model(self, ngram_len, word_ngrams):
+    def prune(self, min_df=1, min_count=1, max_features=None):
+        """Keeps only the ngrams found in at least min_df Documents and
+        at least min_count times in all, then at most the max_features
+        most frequent of those, for every length of the model. The kept
+        keys are set as self.features and every Document's counts are
+        cut down to them, as are those of Documents counted later.
+        Returns self.features. Summaries are rebuilt by summarise.
+        Every Document's counts are held until then, so pruning saves
+        memory in the model but does not lower the peak of counting."""
+        if self.approximate:
+            raise ValueError("pruning needs the per-document counts, which "
+                             "approximate mode drops")
+        self.features = {}
+        for n in self.ngram_lens:
+            doc_freq, totals = {}, {}
+            for doc in self.documents.values():
+                for key, count in doc.ngram_freqs[n].items():
+                    doc_freq[key] = doc_freq.get(key, 0) + 1
+                    totals[key] = totals.get(key, 0) + count
+            keep = [key for key, count in totals.items()
+                    if count >= min_count and doc_freq[key] >= min_df]
+            if max_features is not None and len(keep) > max_features:
+                keep = heapq.nlargest(max_features, keep,
+                                      key=totals.__getitem__)
+            self.features[n] = set(keep)
+        for doc in self.documents.values():
+            self.filter_counts(doc)
+        self.author_stats = {}
+        return self.features
+    
+    def update_stats(self, author, doc, update):
+        """Applies update ("add" or "remove") with one Document's counts
+        to every NgramStats built for author. In approximate mode the
+        author's SketchStats or HeavyHitters always exist, the Document
+        is recounted if its counts were dropped, and they are dropped
+        again after."""
+        if not self.approximate:
+            for n, stats in self.author_stats.get(author, {}).items():
+                getattr(stats, update)(doc.ngram_freqs[n])
+            return
+        stats = self.author_stats.setdefault(author, {})
+        if not doc.ngram_freqs:
+            self.count_document(doc)
+        number = self.doc_numbers.pop(doc.doc_id, None)
+        for n in self.ngram_lens:
+            if n not in stats:
+                stats[n] = (SketchStats(*self.sketch) if self.sketch
+                            else HeavyHitters(self.heavy_hitters))
+            if update == "add":
+                number = stats[n].add(doc.ngram_freqs[n])
+            else:
+                stats[n].remove(doc.ngram_freqs[n], number)
+        if update == "add":
+            self.doc_numbers[doc.doc_id] = number
+        doc.ngram_freqs, doc.ngram_freq, doc.ngrams = {}, {}, []
+    
+    @property
+    def approximate(self):
+        """Whether set_model keeps per-author summaries instead of
+        per-document counts"""
+        return bool(self.sketch or self.heavy_hitters)
+    
+    def set_model(self, ngram_len, word_ngrams, engine="python",
+                  workers=None, executor=None, sketch=None,
+                  heavy_hitters=None, min_df=1, min_count=1,
+                  max_features=None, stop=()):
         """Creates/updates ngrams and freq. counts for every Document
-        in corpus"""
-        for i in range(self.doc_count):
-            self.documents[i].preprocess_document(word_ngrams)
-            self.documents[i].set_ngrams(ngram_len)
-            
-    def calc_stats(self, lst, num_docs):
-               """Returns calculates mean and standard deviation
-               for a list of non-zero frequency counts"""
-               zeroes = [0]*(num_docs - len(lst))
-               result_lst = lst + zeroes
-               avg = mean(result_lst)
-               ss = sum_squares(result_lst, avg)
-               std = stdev(ss, len(result_lst))
-               return round(avg, 2), round(std, 2)
-           
+        in corpus.
+        ngram_len may be a single length or an iterable of lengths,
+        e.g. range(1, 21), to count every length in one pass per
+        Document. summarise can then read any of those lengths.
+        engine selects the counting engine (see Document.ENGINES).
+        workers > 1 counts the Documents in a process pool of that size;
+        alternatively pass any concurrent.futures executor, which is left
+        running. Workers return count tables rather than Documents, and
+        they are merged in document order, so the model (vocabulary ids
+        included) is the same whatever the number of workers.
+        With self.cache set, only the lengths of Documents missing from
+        the cache are counted, and their tables are added to it.
+        sketch=(width, depth[, capacity]) selects approximate mode: the
+        counts of each Document are added to its author's SketchStats
+        (built with those arguments) as soon as they are made, then
+        dropped. heavy_hitters=k does the same with a HeavyHitters of
+        capacity k per author.
+        The ngrams in stop (see stop_ngrams) are dropped from each
+        Document as it is counted. min_df, min_count and max_features
+        then prune the counts once every Document is counted (see
+        prune), so the peak memory of counting is not reduced; they
+        cannot be used in approximate mode."""
+        if sketch and heavy_hitters:
+            raise ValueError("choose one of sketch and heavy_hitters")
+        pruned = (min_df, min_count, max_features) != (1, 1, None)
+        if pruned and (sketch or heavy_hitters):
+            raise ValueError("pruning needs the per-document counts, which "
+                             "approximate mode drops")
+        self.ngram_lens = orders = ngram_orders(ngram_len)
+        self.word_ngrams = word_ngrams
+        self.engine = engine
+        self.sketch = tuple(sketch) if sketch else None
+        self.heavy_hitters = heavy_hitters
+        self.author_stats = {}
+        self.doc_numbers = {}
+        self.features = None
+        self.stop_keys = {} if stop else None
+        self.stop_pending = self.stop_ngrams(stop) if stop else []
+        if self.stats is not None:
+            started = self.stats.start()
+        serial = executor is None and (workers or 1) <= 1
+        if serial and self.cache is None:
+            for doc_id, doc in self.documents.items():
+                self.count_document(doc)
+                if self.approximate:
+                    self.update_stats(self.doc_authors[doc_id], doc, "add")
+            if pruned:
+                self.prune(min_df, min_count, max_features)
+            if self.stats is not None:
+                self.stats.record("set_model", started,
+                                  documents=len(self.documents))
+            return
+        docs = list(self.documents.values())
+        cache = self.cache
+        digests = [cache.digest(doc) if cache else None for doc in docs]
+        missing = [tuple(n for n in orders
+                         if not (cache and cache.has(digest, word_ngrams, n)))
+                   for digest in digests]
+        tasks = [(doc.text, doc.source, word_ngrams, lens, engine)
+                 for doc, lens in zip(docs, missing) if lens]
+        if serial:
+            pool = None
+            counted = map(count_table, tasks)
+        else:
+            pool = executor or ProcessPoolExecutor(max_workers=workers)
+            #A few tasks per worker amortises pickling without losing balance
+            chunksize = max(1, len(tasks) //
+                            (4 * (workers or os.cpu_count() or 1)))
+            counted = pool.map(count_table, tasks, chunksize=chunksize)
+        try:
+            for doc, digest, lens in zip(docs, digests, missing):
+                tables = {}
+                if lens:
+                    tokens, freqs = next(counted)
+                    for n in lens:
+                        tables[n] = tokens, freqs[n]
+                        if cache:
+                            cache.put(digest, word_ngrams, n, tokens, freqs[n])
+                for n in orders:
+                    if n not in tables:
+                        tables[n] = cache.get(digest, word_ngrams, n)
+                    if tables[n] is None:
+                        #The entry went missing since has(): count it here
+                        tokens, freqs = count_table((doc.text, doc.source,
+                                                     word_ngrams, n, engine))
+                        tables[n] = tokens, freqs[n]
+                        cache.put(digest, word_ngrams, n, *tables[n])
+                freqs = {}
+                for n in orders:
+                    tokens, freq = tables[n]
+                    if word_ngrams:
+                        freq = remap_counts({n: freq}, tokens,
+                                            self.vocabulary)[n]
+                    freqs[n] = freq
+                doc.word_ngrams = word_ngrams
+                doc.set_counts(freqs)
+                if self.stop_keys is not None:
+                    self.filter_counts(doc)
+                if self.approximate:
+                    self.update_stats(self.doc_authors[doc.doc_id], doc, "add")
+        finally:
+            if pool is not None and executor is None:
+                pool.shutdown()
+        if pruned:
+            self.prune(min_df, min_count, max_features)
+        if self.stats is not None:
+            self.stats.record("set_model", started, documents=len(docs))
             
-    def summarise(self, author, num=20):
+    def sweep(self, orders, modes, authors, query, num=20, engine="python",
+              workers=None):
+        """Evaluate every (ngram length, word_ngrams) configuration in
+        orders x modes: set the model, summarise the top num ngrams of
+        query and of each author in authors (default: every other
+        author), and compute the distance of each author from query.
+        Returns a list of SweepResult rows in configuration order.
+        Configurations run in a process pool of workers processes when
+        workers > 1. Each worker builds its own Corpus once from the raw
+        texts (inherited, not copied, where processes fork), so the
+        model of this Corpus is left untouched either way. Run serially,
+        all orders of a mode are counted in a single pass instead."""
+        if authors is None:
+            authors = [a for a in self.author_docs if a != query]
+        documents = [(doc.text, doc.source, self.doc_authors[i])
+                     for i, doc in self.documents.items()]
+        if (workers or 1) <= 1:
+            tasks = [(tuple(orders), mode, tuple(authors), query, num, engine)
+                     for mode in modes]
+            corpus = sweep_corpus(documents)
+            rows = [evaluate_configs(corpus, task) for task in tasks]
+        else:
+            tasks = [((n,), mode, tuple(authors), query, num, engine)
+                     for mode in modes for n in orders]
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=init_sweep_worker,
+                                     initargs=(documents,)) as pool:
+                rows = list(pool.map(sweep_configs, tasks))
+        return [row for group in rows for row in group]
+    
+    def summarise(self, author, num=20, ngram_len=None):
         """Returns the average ngram occurence and std. deviation for 
         the top n-occurring ngrams for a collection of writings by an
-        author."""
+        author.
+        ngram_len selects one of the lengths counted by set_model
+        (default: the shortest). After build_index any other length is
+        read from the index, in the index's mode."""
         
-        doc_ngrams = [self.documents[d].ngram_freq for d in self.author_docs[author]]
-        num_documents = len(self.author_docs[author])
-        
-        counts = {}
-        #Loop through doc_ngrams and add counts to list
-        for doc in doc_ngrams:
-            #Calculate total number of ngrams in document
-            total_ngrams = sum(v for v in doc.values()) #Number of unique
-                                                         #ngrams in document
-            for k, v in doc.items():
-                if k in counts.keys():
-                    counts[k]['frequency'].append(doc.get(k, 0))
-                    counts[k]['total_freq'] += doc.get(k, 0)
-                    counts[k]['num_ngrams'].append(total_ngrams)
-                else:
-                    counts[k] = {'frequency': [doc.get(k, 0)], 
-                                "total_freq": doc.get(k, 0),
-                                'num_ngrams': [total_ngrams]}
-        #Sort the dictionary on total_freq to return top n-occuring keys
-        top_ngram_keys = sorted(counts, 
-                                key=lambda x: counts[x]['total_freq'], 
-                                reverse=True)[:num]
-        #Then calculate mean and standard deviation on this subset.
-        result = {k: self.calc_stats(counts[k]['frequency'], 
-                                     num_documents) for k in top_ngram_keys}
+        if self.stats is not None:
+            started = self.stats.start()
+        if self.index is not None and ngram_len is not None \
+           and ngram_len not in self.ngram_lens:
+            result = self.index.summary(self.author_docs[author], ngram_len,
+                                        num)
+            self.summary.update({author: result})
+            self.summary_params[author] = (ngram_len, self.index.word_ngrams)
+            if self.stats is not None:
+                self.stats.record("summarise", started, ngrams=len(result),
+                                  documents=len(self.author_docs[author]))
+            return result
+        ngram_len = self.model_len(ngram_len)
+        stats = self.author_stats.setdefault(author, {}).get(ngram_len)
+        if stats is None:
+            doc_ngrams = [self.documents[d].ngram_freqs[ngram_len]
+                          for d in self.author_docs[author]]
+            stats = NgramStats()
+            #Loop through doc_ngrams and add counts to the accumulators
+            for doc in doc_ngrams:
+                stats.add(doc)
+            #Kept up to date by insert/remove/replace_document
+            self.author_stats[author][ngram_len] = stats
+        if self.approximate:
+            result = stats.summary(num)
+        else:
+            #Read only if a removal left ties to break (see NgramStats.top)
+            result = stats.summary(num, (
+                self.documents[d].ngram_freqs[ngram_len]
+                for d in self.author_docs[author]))
         #Insert summary into dictionary
         self.summary.update({author: result })
+        self.summary_params[author] = (ngram_len, self.word_ngrams)
+        if self.stats is not None:
+            self.stats.record("summarise", started, ngrams=len(result),
+                              documents=len(self.author_docs[author]))
         return result
     
+    def build_index(self, word_ngrams):
+        """Builds self.index, a SuffixIndex of every Document's text
+        preprocessed for word_ngrams, and returns it. Inserting,
+        removing or replacing a Document drops the index."""
+        documents = []
+        for doc_id, doc in self.documents.items():
+            mode = doc.word_ngrams
+            documents.append((doc_id, doc.preprocess_document(word_ngrams)))
+            doc.word_ngrams = mode
+        self.index = SuffixIndex(documents, word_ngrams)
+        return self.index
+    
+    def profiles(self):
+        """Returns AuthorProfiles of the current summaries (see
+        summarise). Word ngram keys are renumbered to a vocabulary of
+        just the words they use."""
+        vocabulary = Vocabulary()
+        bits = 8 * WORD_WIDTH
+        mask = (1 << bits) - 1
+        summaries = {}
+        for author, summary in self.summary.items():
+            n, word_ngrams = self.summary_params[author]
+            if not word_ngrams:
+                summaries[author] = dict(summary)
+                continue
+            shifts = range(bits * (n - 1), -1, -bits)
+            summaries[author] = renumbered = {}
+            for key, value in summary.items():
+                new = 0
+                for shift in shifts:
+                    token = self.vocabulary.tokens[(key >> shift) & mask]
+                    new = (new << bits) | vocabulary.add(token)
+                renumbered[new] = value
+        return AuthorProfiles(summaries, dict(self.summary_params),
+                              vocabulary)
+    
+    def term_matrix(self, ngram_len=None):
+        """Returns the TermMatrix of the counts of one of the lengths
+        counted by set_model (default: the shortest). Rows are grouped by
+        author in the order of author_docs. Needs NumPy."""
+        if np is None:
+            raise ImportError("Corpus.term_matrix needs NumPy")
+        if self.approximate:
+            raise ValueError("term_matrix needs exact counts; call "
+                             "set_model without sketch or heavy_hitters")
+        ngram_len = self.model_len(ngram_len)
+        columns = {}
+        indptr, indices, counts = array('q', [0]), array('q'), array('q')
+        doc_ids, author_rows = [], {}
+        for author, ids in self.author_docs.items():
+            start = len(doc_ids)
+            for d in ids:
+                freq = self.documents[d].ngram_freqs[ngram_len]
+                indices.extend([columns.setdefault(k, len(columns))
+                                for k in freq])
+                counts.extend(freq.values())
+                indptr.append(len(indices))
+                doc_ids.append(d)
+            author_rows[author] = slice(start, len(doc_ids))
+        return TermMatrix(np.array(indptr), np.array(indices),
+                          np.array(counts), list(columns), doc_ids,
+                          author_rows)
+    
+    def distance_engine(self, ngram_len=None, num=500):
+        """Returns a DistanceEngine over the num most frequent ngrams of
+        one of the lengths counted by set_model. Needs NumPy."""
+        return DistanceEngine(self.term_matrix(ngram_len), num)
+    
+    def count_texts(self, texts, ngram_len=None):
+        """Counts texts under the current model without inserting them.
+        Returns a list of their dicts of ngram frequencies of one of the
+        lengths counted by set_model (default: the shortest)."""
+        ngram_len = self.model_len(ngram_len)
+        freqs = []
+        for text in texts:
+            doc = Document(text, None, self.vocabulary, stats=self.stats,
+                           counts_only=True)
+            doc.word_ngrams = self.word_ngrams
+            doc.set_ngrams(ngram_len, self.engine)
+            freqs.append(doc.ngram_freq)
+        return freqs
+    
+    def model_len(self, ngram_len):
+        """Check that ngram_len was counted by set_model; None gives the
+        shortest length"""
+        if ngram_len is None:
+            ngram_len = self.ngram_lens[0] if self.ngram_lens else 0
+        if ngram_len not in self.ngram_lens:
+            raise ValueError("ngram_len {0} is not in the model {1}; "
+                             "call set_model first".format(ngram_len,
+                                                           self.ngram_lens))
+        return ngram_len
+    
     def print_summary(self):
         """Outputs results of summary method for standard output."""
         output = "\n\n"
         for author in self.summary.keys(): 
             output += "Author: {0}\n---------\n".format(author)
             output += "ngram,\t\t av_occurence,\t\tstd_deviation\n"
+            n, word_ngrams = self.summary_params[author]
             for k in self.summary[author].keys():
-                output += ('"{0}",\t\t{1},\t\t{2}\n'.format(k, 
+                output += ('"{0}",\t\t{1},\t\t{2}\n'.format(
+                           decode_ngram(k, n, word_ngrams, self.vocabulary),
                            self.summary[author][k][0], 
                            self.summary[author][k][1]))
         return output
-def mean(lst):
-    return sum(l for l in lst) / len(lst)
+    
+    def decode(self, key, n=None, word_ngrams=None):
+        """Return the readable form of a packed ngram key. n and
+        word_ngrams default to the current model."""
+        if word_ngrams is None:
+            word_ngrams = self.word_ngrams
+        return decode_ngram(key, n or self.ngram_lens[0], word_ngrams,
+                            self.vocabulary)
+    
+    
+def encode_tokens(tokens):
+    """Return a list of strings as a count, their UTF-8 lengths and
+    their UTF-8 bytes"""
+    encoded = [t.encode("utf-8", "surrogatepass") for t in tokens]
+    lengths = array('I', map(len, encoded))
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    return struct.pack("<I", len(encoded)) + lengths.tobytes() + \
+           b"".join(encoded)
+
+
+def decode_tokens(data, start):
+    """Inverse of encode_tokens from data[start:]; returns the list of
+    strings and the offset after them"""
+    count, = struct.unpack_from("<I", data, start)
+    start += 4
+    lengths = array('I')
+    lengths.frombytes(data[start:start + 4 * count])
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    start += 4 * count
+    tokens = []
+    for length in lengths:
+        tokens.append(data[start:start + length].decode("utf-8",
+                                                        "surrogatepass"))
+        start += length
+    return tokens, start
+
+
+def load_profiles(path):
+    """Read AuthorProfiles written by AuthorProfiles.save. Raises
+    ValueError if path is not a profiles file of a known version."""
+    with open(path, "rb") as f:
+        data = f.read()
+    head = struct.calcsize("<4sH")
+    magic, version = struct.unpack_from("<4sH", data)
+    if magic != AuthorProfiles.MAGIC:
+        raise ValueError("{0} is not an ngrammer profiles file".format(path))
+    if version > AuthorProfiles.VERSION:
+        raise ValueError("{0} has profiles version {1}; this ngrammer reads "
+                         "up to {2}".format(path, version,
+                                            AuthorProfiles.VERSION))
+    data = zlib.decompress(data[head:])
+    tokens, start = decode_tokens(data, 0)
+    summaries, params = {}, {}
+    from_bytes = int.from_bytes
+    while start < len(data):
+        (author,), start = decode_tokens(data, start)
+        n, word_ngrams, num = struct.unpack_from("<IBI", data, start)
+        start += struct.calcsize("<IBI")
+        size = n * unit_width(word_ngrams)
+        keys = [from_bytes(data[s:s + size], "big")
+                for s in range(start, start + size * num, size)]
+        start += size * num
+        values = array('d')
+        values.frombytes(data[start:start + 16 * num])
+        if sys.byteorder == "big":
+            values.byteswap()
+        start += 16 * num
+        summaries[author] = dict(zip(keys, zip(values[:num], values[num:])))
+        params[author] = (n, bool(word_ngrams))
+    return AuthorProfiles(summaries, params, Vocabulary(tokens))
+
+
+def build_profiles(path, ngram_len=4, word_ngrams=False, num=20,
+                   exclude=(), include=("*.txt",), engine="python",
+                   workers=None):
+    """Load a corpus from path, count it and return the AuthorProfiles
+    of every author's summary"""
+    corpus = Corpus(counts_only=True).load_corpus(
+        path, exclusion_list=exclude, include=include)
+    corpus.set_model(ngram_len, word_ngrams, engine, workers=workers)
+    for author in sorted(corpus.author_docs):
+        corpus.summarise(author, num)
+    return corpus.profiles()
+
+
+def count_table(task):
+    """Count one document, normally in a worker process.
+    task is (text, source, word_ngrams, orders, engine) as for Document
+    and set_ngrams. Returns the compact table (tokens, ngram_freqs):
+    in word mode the keys use the ids of a private vocabulary whose
+    tokens are listed in id order (see remap_counts)."""
+    text, source, word_ngrams, orders, engine = task
+    doc = Document(text, None, Vocabulary(), source, counts_only=True)
+    doc.word_ngrams = word_ngrams
+    doc.set_ngrams(orders, engine)
+    return doc.vocabulary.tokens, doc.ngram_freqs
+
+
+def remap_counts(ngram_freqs, tokens, vocabulary):
+    """Re-key word ngram counts made with a private vocabulary (listed
+    in id order by tokens) to ids of vocabulary, adding any new words.
+    Order of keys is kept."""
+    ids = vocabulary.encode(tokens)
+    if ids == list(range(len(ids))):
+        return ngram_freqs
+    bits = 8 * WORD_WIDTH
+    mask = (1 << bits) - 1
+    remapped = {}
+    for n, freq in ngram_freqs.items():
+        shifts = range(bits * (n - 1), -1, -bits)
+        table = remapped[n] = {}
+        for key, count in freq.items():
+            new = 0
+            for shift in shifts:
+                new = (new << bits) | ids[(key >> shift) & mask]
+            table[new] = count
+    return remapped
+
+
+def dump_table(tokens, freq, key_size):
+    """Serialise a count table (tokens, freq) whose keys are key_size
+    bytes long to the binary form stored by CountCache: a header, the
+    UTF-8 tokens with their lengths, the keys as fixed-width big-endian
+    fields and the counts as 8-byte integers, zlib-compressed"""
+    encoded = [t.encode("utf-8", "surrogatepass") for t in tokens]
+    lengths = array('I', map(len, encoded))
+    counts = array('Q', freq.values())
+    if sys.byteorder == "big":
+        lengths.byteswap()
+        counts.byteswap()
+    keys = b"".join(k.to_bytes(key_size, "big") for k in freq)
+    header = struct.pack("<4sIII", b"NGC1", len(tokens), len(freq), key_size)
+    return zlib.compress(header + lengths.tobytes() + b"".join(encoded)
+                         + keys + counts.tobytes())
+
+
+def load_table(data, key_size):
+    """Inverse of dump_table; raises ValueError if data is not a table
+    with keys of key_size bytes"""
+    data = zlib.decompress(data)
+    head = struct.calcsize("<4sIII")
+    magic, num_tokens, num_keys, size = struct.unpack_from("<4sIII", data)
+    if magic != b"NGC1" or size != key_size:
+        raise ValueError("not a count table with {0}-byte keys".format(
+                         key_size))
+    lengths = array('I')
+    lengths.frombytes(data[head:head + 4 * num_tokens])
+    counts = array('Q')
+    counts.frombytes(data[len(data) - 8 * num_keys:])
+    if sys.byteorder == "big":
+        lengths.byteswap()
+        counts.byteswap()
+    start = head + 4 * num_tokens
+    tokens = []
+    for length in lengths:
+        tokens.append(data[start:start + length].decode("utf-8",
+                                                        "surrogatepass"))
+        start += length
+    if start + key_size * num_keys + 8 * num_keys != len(data):
+        raise ValueError("count table has the wrong size")
+    from_bytes = int.from_bytes
+    keys = [from_bytes(data[s:s + key_size], "big")
+            for s in range(start, start + key_size * num_keys, key_size)]
+    return tokens, dict(zip(keys, counts))
+
+
+#One configuration's result from Corpus.sweep: distances maps each
+#author to its distance from the query
+SweepResult = collections.namedtuple("SweepResult",
+                                     "ngram_len word_ngrams distances")
+
+#The private Corpus of a sweep worker, set by init_sweep_worker
+_sweep_corpus = None
+
+
+def sweep_corpus(documents):
+    """Return the Corpus a sweep evaluates configurations on, built from
+    (text, source, author) tuples"""
+    corpus = Corpus()
+    for text, source, author in documents:
+        corpus.insert_document(text, author, source)
+    return corpus
+
+
+def init_sweep_worker(documents):
+    """Build the Corpus of a sweep pool worker (see sweep_corpus)"""
+    global _sweep_corpus
+    _sweep_corpus = sweep_corpus(documents)
+
+
+def sweep_configs(task):
+    """Evaluate Corpus.sweep configurations of one mode on the pool
+    worker's Corpus (see evaluate_configs)"""
+    return evaluate_configs(_sweep_corpus, task)
+
+
+def evaluate_configs(corpus, task):
+    """Evaluate Corpus.sweep configurations of one mode on corpus,
+    counting all their orders in one pass. task is
+    (orders, word_ngrams, authors, query, num, engine); returns a list
+    of SweepResult."""
+    orders, word_ngrams, authors, query, num, engine = task
+    corpus.set_model(orders, word_ngrams, engine)
+    rows = []
+    for n in orders:
+        target = corpus.summarise(query, num, ngram_len=n)
+        distances = {a: compute_distance(corpus.summarise(a, num, n), target)
+                     for a in authors}
+        rows.append(SweepResult(n, word_ngrams, distances))
+    return rows
+
+
+def manhattan_distances(q, p):
+    """Returns the array of Manhattan distances from each row of q to
+    each row of p, one row of p at a time to bound memory"""
+    if not len(p):
+        return np.zeros((len(q), 0))
+    return np.column_stack([np.abs(q - row).sum(axis=1) for row in p])
+
+
+def suffix_array(units):
+    """Return the suffix array of a sequence of ints, by prefix doubling:
+    suffixes are ranked on their first k units, then on pairs of those
+    ranks for 2k units, until every rank differs. Vectorised with NumPy
+    when it is installed."""
+    n = len(units)
+    if np is not None:
+        rank = np.unique(np.asarray(units, dtype=np.int64),
+                         return_inverse=True)[1].ravel() + 1
+        k = 1
+        while True:
+            following = np.zeros(n, dtype=np.int64)
+            following[:max(n - k, 0)] = rank[k:]
+            keys = rank * (n + 1) + following
+            order = np.argsort(keys, kind="stable")
+            ranked = keys[order]
+            rank = np.empty(n, dtype=np.int64)
+            rank[order] = np.cumsum(np.concatenate(
+                ([1], ranked[1:] != ranked[:-1])))
+            if n == 0 or rank.max() == n:
+                return array('q', order.astype(np.int64).tobytes())
+            k *= 2
+    code = {u: r for r, u in enumerate(sorted(set(units)), 1)}
+    rank = [code[u] for u in units]
+    order = list(range(n))
+    k = 1
+    while True:
+        following = rank[k:] + [0] * min(k, n)
+        keys = [r * (n + 1) + f for r, f in zip(rank, following)]
+        order.sort(key=keys.__getitem__)
+        rank = [0] * n
+        r, last = 0, None
+        for i in order:
+            if keys[i] != last:
+                r += 1
+                last = keys[i]
+            rank[i] = r
+        if r == n:
+            return array('q', order)
+        k *= 2
+
+
+def lcp_array(units, suffixes):
+    """Return the LCP array of a suffix array (Kasai's algorithm):
+    lcp[r] is the length of the common prefix of suffixes r - 1 and r"""
+    n = len(units)
+    rank = [0] * n
+    for r, p in enumerate(suffixes):
+        rank[p] = r
+    lcp = array('q', bytes(8 * n))
+    h = 0
+    for i in range(n):
+        r = rank[i]
+        if r == 0:
+            h = 0
+            continue
+        j = suffixes[r - 1]
+        while i + h < n and j + h < n and units[i + h] == units[j + h]:
+            h += 1
+        lcp[r] = h
+        if h:
+            h -= 1
+    return lcp
+
+
+def unit_width(word_ngrams):
+    """Return the number of bytes per packed unit for a tokenisation mode"""
+    return WORD_WIDTH if word_ngrams else CHAR_WIDTH
+
 
+def pack_units(units, width):
+    """Return units as a bytes buffer of width-byte big-endian fields,
+    so that int.from_bytes of any n-unit slice is that window's key"""
+    units = array('I', units)
+    if sys.byteorder == "little":
+        units.byteswap()
+    buf = units.tobytes()
+    if width == 3:
+        #Drop the high byte of each code point, which is always zero
+        buf = bytearray(buf)
+        del buf[::4]
+        buf = bytes(buf)
+    return buf
 
-def sum_squares(lst, mean):
-    return sum((x-mean)**2 for x in lst)
+
+def decode_ngram(key, n, word_ngrams, vocabulary):
+    """Unpack an ngram key of length n into the readable
+    "unit, unit, ..." form"""
+    bits = 8 * unit_width(word_ngrams)
+    mask = (1 << bits) - 1
+    units = [(key >> (bits * i)) & mask for i in range(n - 1, -1, -1)]
+    if word_ngrams:
+        return ", ".join(vocabulary.tokens[u] for u in units)
+    return ", ".join(chr(u) for u in units)
+
+
+def ngram_orders(ngram_len):
+    """Return a sorted tuple of ngram lengths from an int or iterable"""
+    if isinstance(ngram_len, int):
+        orders = (ngram_len,)
+    else:
+        orders = tuple(sorted(set(ngram_len)))
+    if not orders or min(orders) < 1:
+        raise ValueError("ngram lengths must be positive integers")
+    return orders
 
 
 def stdev(ss, n):
     return (ss/n)**0.5 
 
 
-def compute_distance(a, b):
+def compute_distance(a, b, stats=None):
     """Compute the Euclidean distance two authors
-    based on the average ngram frequencies of ngrams that exist in both."""
+    based on the average ngram frequencies of ngrams that exist in both.
+    stats, normally corpus.stats, records the call if not None."""
+    if stats is not None:
+        started = stats.start()
     sums = 0
+    shared = 0
     for key in a.keys():
         if key in b.keys():
             sums += pow(a[key][0] - b[key][0], 2)
+            shared += 1
+    if stats is not None:
+        stats.record("compute_distance", started, ngrams=len(a) + len(b),
+                     keys=shared)
     return sums ** .5
 
 
 
 #sample usage
 
-z = zipfile.ZipFile("texts.zip")
-z.extractall()
+def sample(path="texts.zip"):
+    """Runs the sample usage on the texts in path: prints the corpus,
+    the top 4-char-grams of each author, and which of A and B is nearer
+    to C over 40 configurations (see SAMPLE OUTPUT below)"""
+    corpus = Corpus()
+    #The texts are read straight from the zipfile.
+    #Exclusion_list is a list of filenames to ignore from loaded zipfile
+    corpus.load_corpus(path, exclusion_list=["readme.txt"])
+    #Set the model to 4-char-grams
+    corpus.set_model(4, False)
 
-corpus = Corpus()
-#Exclusion_list is a list of filenames to ignore from loaded zipfile
-corpus.load_corpus(exclusion_list=["readme.txt"])
-#Set the model to 4-char-grams
-corpus.set_model(4, False)
+    #Summarise the most common num ngrams for each author; print(corpus)
+    #shows the summaries. The author name is taken to be the first
+    #letter of the filename
+    for author in "ABC":
+        corpus.summarise(author, num=20)
 
-#Return a dict of the most common num ngrams for an author
-#The author name is taken to be the first letter of the filename
-results_a = corpus.summarise('A', num=20)
-results_b = corpus.summarise('B', num=20)
-results_c = corpus.summarise('C', num=20)
+    #Eyeball the output for the corpus
+    print(corpus) #See sample output below
 
+    """Looking over differences between the average ngram occurences for C, the 
+    mystery document, and the two labelled collections, it would appear there
+    is more commonality between Author B than Author A. The best parameters
+    would appear to be for two-word ngrams, and four-character ngrams.
 
-#Eyeball the output for the corpus
-print(corpus) #See sample output below
+    A second method involved calculating the Eucldiean distance between the 
+    average occurences of a set of the most-frequently occurring ngrams bewteen
+    one of the sample collections and the single document.
 
-"""Looking over differences between the average ngram occurences for C, the 
-mystery document, and the two labelled collections, it would appear there
-is more commonality between Author B than Author A. The best parameters
-would appear to be for two-word ngrams, and four-character ngrams.
+    The distance was calculated with a model which created n-grams of up to 20
+    words or characters in length. 
 
-A second method involved calculating the Eucldiean distance between the 
-average occurences of a set of the most-frequently occurring ngrams bewteen
-one of the sample collections and the single document.
-
-The distance was calculated with a model which created n-grams of up to 20
-words or characters in length. 
-
-In 10 separate tests where Euclidean distances from C were both
-non-zero, A was judged closer to C 2 times, while 
-B was ranked closer on 8 occasions.
+    In 10 separate tests where Euclidean distances from C were both
+    non-zero, A was judged closer to C 3 times, while 
+    B was ranked closer on 7 occasions.
 
-Conclusion: The document 'C' appears on evidence provided by ngram analysis
-to have been written by author 'B'.
+    Conclusion: The document 'C' appears on evidence provided by ngram analysis
+    to have been written by author 'B'.
 
-"""
+    """
 
 
-print("""Calculating Euclidean distances average occurence of ngrams in C and
+    print("""Calculating Euclidean distances average occurence of ngrams in C and
 between collections A and B. Nested loop will run over n-length ngrams between
 1 and 20, and run over word and character ngrams.""")
 
 
-results = {"A": 0, "B": 0}
-non_zero_tests = 0
+    results = {"A": 0, "B": 0}
+    non_zero_tests = 0
 
-for boolean in [True, False]:
-    for n in range(1, 21):
-        corpus.set_model(n, boolean) 
-        
-        results_a = corpus.summarise('A', 20)
-        results_b = corpus.summarise('B', 20)
-        results_c = corpus.summarise('C', 20)
-        
-        distancea_c = compute_distance(results_a, results_c)
-        distanceb_c = compute_distance(results_b, results_c)
-        
-        if (distancea_c and distanceb_c) == 0:
-            break
-        non_zero_tests += 1
-        if distancea_c < distanceb_c:
-            results["A"] += 1
-        else:
-            results["B"] += 1
-        
-        print(str(n)+"-length", "Word ngrams" if boolean else "Char ngrams")
-        print("Sample ngram: ", corpus.documents[0].ngrams[1])
-        print("A to C: ", round(distancea_c, 2))
-        print("B to C: ", round(distanceb_c, 2), "\n")
-        
+    #Evaluate all 40 configurations, using every core
+    table = corpus.sweep(range(1, 21), [True, False], ["A", "B"], "C", num=20,
+                         workers=os.cpu_count())
+
+    for boolean in [True, False]:
+        for row in table:
+            if row.word_ngrams != boolean:
+                continue
+            n = row.ngram_len
+            distancea_c = row.distances["A"]
+            distanceb_c = row.distances["B"]
+
+            if (distancea_c and distanceb_c) == 0:
+                break
+            non_zero_tests += 1
+            if distancea_c < distanceb_c:
+                results["A"] += 1
+            else:
+                results["B"] += 1
+
+            print(str(n)+"-length", "Word ngrams" if boolean else "Char ngrams")
+            print("Sample ngram: ", corpus.documents[0].get_ngram(1, n, boolean))
+            print("A to C: ", round(distancea_c, 2))
+            print("B to C: ", round(distanceb_c, 2), "\n")
 
 
 
-print("""In {0} separate tests where Euclidean distances from C were both
+
+    print("""In {0} separate tests where Euclidean distances from C were both
 non-zero, A was judged closer to C {1} times, while 
 B was ranked closer on {2} occasions.
         """.format(non_zero_tests, results['A'], results['B']))
 
-
 """
 SAMPLE OUTPUT
 -------------
@@ -451,47 +3042,291 @@ A to C:  9.13
 B to C:  8.05 
 
 1-length Char ngrams
-Sample ngram:  _
-A to C:  272.14
-B to C:  112.36 
+Sample ngram:  A
+A to C:  260.24
+B to C:  112.61 
 
 2-length Char ngrams
-Sample ngram:  _, c
-A to C:  118.56
-B to C:  59.83 
+Sample ngram:  A, _
+A to C:  112.71
+B to C:  63.41 
 
 3-length Char ngrams
-Sample ngram:  _, c, e
-A to C:  79.38
-B to C:  51.49 
+Sample ngram:  A, _, c
+A to C:  77.61
+B to C:  55.78 
 
 4-length Char ngrams
-Sample ngram:  _, c, e, r
-A to C:  58.62
-B to C:  34.63 
+Sample ngram:  A, _, c, e
+A to C:  55.79
+B to C:  34.84 
 
 5-length Char ngrams
-Sample ngram:  _, c, e, r, t
-A to C:  39.73
-B to C:  33.18 
+Sample ngram:  A, _, c, e, r
+A to C:  34.79
+B to C:  34.44 
 
 6-length Char ngrams
-Sample ngram:  _, c, e, r, t, a
-A to C:  16.24
-B to C:  14.88 
+Sample ngram:  A, _, c, e, r, t
+A to C:  16.05
+B to C:  16.62 
 
 7-length Char ngrams
-Sample ngram:  _, c, e, r, t, a, i
-A to C:  6.91
-B to C:  7.7 
+Sample ngram:  A, _, c, e, r, t, a
+A to C:  7.11
+B to C:  7.52 
 
 8-length Char ngrams
-Sample ngram:  _, c, e, r, t, a, i, n
-A to C:  6.96
-B to C:  5.2 
+Sample ngram:  A, _, c, e, r, t, a, i
+A to C:  6.12
+B to C:  5.08 
 
 In 10 separate tests where Euclidean distances from C were both
-non-zero, A was judged closer to C 2 times, while 
-B was ranked closer on 8 occasions.
+non-zero, A was judged closer to C 3 times, while 
+B was ranked closer on 7 occasions.
         
-"""
\ No newline at end of file
+"""
+
+
+def parse_orders(text):
+    """Parse ngram lengths such as "4", "1-20" or "2,4,8" into a sorted
+    tuple (see ngram_orders)"""
+    orders = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        orders.extend(range(int(first), int(last or first) + 1))
+    return ngram_orders(orders)
+
+
+def load_args(args):
+    """Return the Corpus named by the command line arguments: a packed
+    corpus if args.corpus has an index, else any path load_corpus reads"""
+    corpus = Corpus(CountCache(args.cache) if args.cache else None,
+                    args.counts_only)
+    if os.path.exists(args.corpus + ".idx"):
+        return corpus.open_packed(args.corpus)
+    return corpus.load_corpus(args.corpus, exclusion_list=args.exclude,
+                              stream=args.stream, include=args.include)
+
+
+def set_model_args(corpus, args):
+    stop = ()
+    if args.stop:
+        with open(args.stop, encoding="utf-8") as f:
+            stop = [line.strip("\r\n") for line in f if line.strip()]
+    corpus.set_model(args.ngram_len, args.words, args.engine,
+                     workers=args.workers, min_df=args.min_df,
+                     min_count=args.min_count,
+                     max_features=args.max_features, stop=stop)
+
+
+def command_build(args):
+    """Count the corpus, filling the count cache, and optionally write it
+    as a packed corpus"""
+    corpus = load_args(args)
+    set_model_args(corpus, args)
+    if args.pack:
+        corpus.pack(args.pack)
+    if args.profiles:
+        for author in args.author or sorted(corpus.author_docs):
+            corpus.summarise(author, args.num)
+        corpus.profiles().save(args.profiles)
+    print(corpus)
+    if corpus.cache is not None:
+        print("Count cache: {0} hits, {1} misses".format(
+              corpus.cache.hits, corpus.cache.misses), file=sys.stderr)
+
+
+def command_summarise(args):
+    """Print the top ngrams of each author for every length"""
+    corpus = load_args(args)
+    set_model_args(corpus, args)
+    authors = args.author or sorted(corpus.author_docs)
+    for n in args.ngram_len:
+        corpus.summary = {}
+        for author in authors:
+            corpus.summarise(author, args.num, n)
+        print("{0}-length {1} ngrams".format(n, "Word" if args.words
+                                             else "Char"), end="")
+        print(corpus.print_summary())
+
+
+def command_attribute(args):
+    """Print the distance from every query document to every author and
+    the nearest author, for every length, loading the corpus once"""
+    corpus = load_args(args)
+    set_model_args(corpus, args)
+    authors = args.author or sorted(corpus.author_docs)
+    names, texts = [], []
+    for path in args.queries:
+        #Only --include applies: --exclude is for the corpus
+        for name, source, read in iter_texts(path):
+            if matches(name, args.include):
+                names.append(name)
+                texts.append(read())
+    for n in args.ngram_len:
+        freqs = corpus.count_texts(texts, n)
+        if args.metric == "top":
+            profiles = {a: corpus.summarise(a, args.num, n) for a in authors}
+            rows = []
+            for freq in freqs:
+                top = heapq.nlargest(args.num, freq, key=freq.__getitem__)
+                query = {k: (freq[k], 0.0) for k in top}
+                rows.append([compute_distance(profiles[a], query)
+                             for a in authors])
+        else:
+            engine = corpus.distance_engine(n, args.features)
+            columns = [engine.authors.index(a) for a in authors]
+            rows = engine.distances(freqs, args.metric)[:, columns].tolist()
+        for name, row in zip(names, rows):
+            nearest = authors[row.index(min(row))] if row else ""
+            print("\t".join([name, str(n), nearest] + [
+                  "{0}={1}".format(a, round(d, 4))
+                  for a, d in zip(authors, row)]))
+
+
+def command_score(args):
+    """Print the distance from every query document to every author of
+    saved profiles and the nearest author, without the corpus"""
+    profiles = load_profiles(args.profiles)
+    authors = args.author or list(profiles.summaries)
+    for path in args.queries:
+        for name, source, read in iter_texts(path):
+            if not matches(name, args.include):
+                continue
+            distances = profiles.distances(read(), authors)
+            row = [distances[a] for a in authors]
+            nearest = authors[row.index(min(row))] if row else ""
+            print("\t".join([name, nearest] + [
+                  "{0}={1}".format(a, round(d, 4))
+                  for a, d in zip(authors, row)]))
+
+
+def command_serve(args):
+    """Serve saved profiles until interrupted"""
+    server = AttributionServer(load_profiles(args.profiles),
+                               (args.host, args.port))
+    print("Serving {0} on http://{1}:{2}/".format(
+          args.profiles, *server.server_address[:2]), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def command_sweep(args):
+    """Print the distance from the query author to every other author
+    for every length and mode"""
+    corpus = load_args(args)
+    authors = args.author or sorted(a for a in corpus.author_docs
+                                    if a != args.query)
+    modes = [{"word": True, "char": False}[m] for m in args.modes]
+    table = corpus.sweep(args.ngram_len, modes, authors, args.query,
+                         num=args.num, engine=args.engine,
+                         workers=args.workers)
+    for row in table:
+        distances = [row.distances[a] for a in authors]
+        nearest = authors[distances.index(min(distances))]
+        print("\t".join([str(row.ngram_len),
+                         "word" if row.word_ngrams else "char", nearest] + [
+                         "{0}={1}".format(a, round(d, 4))
+                         for a, d in zip(authors, distances)]))
+
+
+def main(argv=None):
+    """Command line entry point; with no arguments runs sample()"""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        sample()
+        return
+    parser = argparse.ArgumentParser(
+        prog="ngrammer", description="N-gram author profiles and "
+        "attribution over a directory, archive or packed corpus")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("corpus", help="directory, zip/tar archive, "
+                        "(compressed) file, or packed corpus")
+    common.add_argument("-n", "--ngram-len", type=parse_orders,
+                        default=(4,), help='lengths, e.g. 4, 1-20 or 2,4 '
+                        '(default 4)')
+    common.add_argument("--words", action="store_true",
+                        help="word ngrams (default: characters)")
+    common.add_argument("--num", type=int, default=20,
+                        help="ngrams per author summary (default 20)")
+    common.add_argument("-a", "--author", action="append",
+                        help="author to report (repeatable; default all)")
+    common.add_argument("--include", action="append", default=None,
+                        help='file name pattern (default "*.txt")')
+    common.add_argument("--exclude", action="append", default=[],
+                        help="file name pattern to skip")
+    common.add_argument("--stream", action="store_true",
+                        help="stream files instead of reading them now")
+    common.add_argument("--engine", default="python",
+                        choices=sorted(Document.ENGINES))
+    common.add_argument("--workers", type=int, default=None,
+                        help="processes to count in")
+    common.add_argument("--cache", help="count cache directory")
+    common.add_argument("--counts-only", action="store_true",
+                        help="keep only counts per document, not their "
+                        "ngrams or preprocessed text")
+    common.add_argument("--min-df", type=int, default=1,
+                        help="drop ngrams in fewer documents than this")
+    common.add_argument("--min-count", type=int, default=1,
+                        help="drop ngrams found fewer times than this")
+    common.add_argument("--max-features", type=int, default=None,
+                        help="keep at most this many ngrams per length")
+    common.add_argument("--stop", help="file of ngrams to drop, one per "
+                        "line")
+    build = commands.add_parser("build", parents=[common],
+                                help="count the corpus and fill the cache")
+    build.add_argument("--pack", help="also write it as a packed corpus")
+    build.add_argument("--profiles", help="also write the author "
+                       "summaries of the shortest length as profiles")
+    build.set_defaults(run=command_build)
+    summarise = commands.add_parser("summarise", parents=[common],
+                                    help="top ngrams of each author")
+    summarise.set_defaults(run=command_summarise)
+    attribute = commands.add_parser("attribute", parents=[common],
+                                    help="nearest author of query documents")
+    attribute.add_argument("queries", nargs="+", help="query files, "
+                           "directories or archives")
+    attribute.add_argument("--metric", default="top", choices=(
+                           ("top",) + DistanceEngine.METRICS),
+                           help="top: compute_distance of the summaries; "
+                           "others use DistanceEngine (needs NumPy)")
+    attribute.add_argument("--features", type=int, default=500,
+                           help="DistanceEngine features (default 500)")
+    attribute.set_defaults(run=command_attribute)
+    score = commands.add_parser("score", help="nearest author of query "
+                                "documents from saved profiles")
+    score.add_argument("profiles", help="file written by build --profiles")
+    score.add_argument("queries", nargs="+", help="query files, "
+                       "directories or archives")
+    score.add_argument("-a", "--author", action="append",
+                       help="author to report (repeatable; default all)")
+    score.add_argument("--include", action="append", default=None,
+                       help='file name pattern (default "*.txt")')
+    score.set_defaults(run=command_score)
+    serve = commands.add_parser("serve", help="serve saved profiles over "
+                                "local HTTP (see AttributionServer)")
+    serve.add_argument("profiles", help="file written by build --profiles")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.set_defaults(run=command_serve)
+    sweep = commands.add_parser("sweep", parents=[common],
+                                help="distances over lengths and modes")
+    sweep.add_argument("--query", required=True,
+                       help="author to compare the others with")
+    sweep.add_argument("--modes", nargs="+", default=["word", "char"],
+                       choices=("word", "char"))
+    sweep.set_defaults(run=command_sweep)
+    args = parser.parse_args(argv)
+    args.include = tuple(getattr(args, "include", None) or ("*.txt",))
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()